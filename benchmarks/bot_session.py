@@ -0,0 +1,110 @@
+"""
+Default vs tuned Bot API session (src/bot_session.py) against a local fake Bot API.
+
+Starts an aiohttp server on 127.0.0.1 that answers sendMessage like Telegram
+does and charges --connect-delay ms for the first request on every new
+connection (TCP + TLS handshake to api.telegram.org). Each session sends
+--bursts bursts of --burst concurrent messages separated by --idle seconds
+of silence, the way report flows and broadcasts hit the API.
+
+    python -m benchmarks.bot_session --bursts 5 --burst 50 --idle 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from src.bot_session import create_bot_session
+
+TOKEN = "42:TEST"
+
+
+class FakeBotAPI:
+    def __init__(self, connect_delay: float, latency: float):
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.transports = set()
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        transport = request.transport
+        if transport not in self.transports:
+            self.transports.add(transport)
+            await asyncio.sleep(self.connect_delay)
+
+        await asyncio.sleep(self.latency)
+        data = await request.post()
+
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": int(data["chat_id"]), "type": "private"},
+                "text": data["text"],
+            },
+        })
+
+
+async def run_session(name: str, session: AiohttpSession, server: FakeBotAPI, port: int, args) -> None:
+    session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")
+    bot = Bot(token=TOKEN, session=session)
+    server.transports.clear()
+    latencies = []
+
+    async def send(i: int) -> None:
+        started = time.perf_counter()
+        await bot.send_message(chat_id=i, text="x" * 200)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    total_started = time.perf_counter()
+    try:
+        for n in range(args.bursts):
+            if n:
+                await asyncio.sleep(args.idle)
+            await asyncio.gather(*(send(i) for i in range(args.burst)))
+    finally:
+        await bot.session.close()
+
+    total = time.perf_counter() - total_started - args.idle * (args.bursts - 1)
+    latencies.sort()
+    print(
+        f"{name:<10}{total:>10.3f}{statistics.median(latencies):>10.1f}"
+        f"{latencies[int(len(latencies) * 0.95) - 1]:>10.1f}{len(server.transports):>14}"
+    )
+
+
+async def main(args) -> None:
+    server = FakeBotAPI(connect_delay=args.connect_delay / 1000, latency=args.latency / 1000)
+    runner = web.AppRunner(server.app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    print(f"{args.bursts} bursts x {args.burst} requests, idle {args.idle} s between bursts\n")
+    print(f"{'session':<10}{'busy, s':>10}{'p50, ms':>10}{'p95, ms':>10}{'connections':>14}")
+
+    try:
+        await run_session("default", AiohttpSession(), server, port, args)
+        await run_session("tuned", create_bot_session(), server, port, args)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--idle", type=float, default=20.0)
+    parser.add_argument("--connect-delay", type=float, default=150.0, help="ms per new connection")
+    parser.add_argument("--latency", type=float, default=40.0, help="ms per request")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -0,0 +1,153 @@
+"""
+Before/after EXPLAIN ANALYZE for the indexes from migration b4d2e8f61a07.
+
+Builds a synthetic multi-year dataset in a throwaway schema of the configured
+database, runs the reporting hot-path queries without the indexes, creates
+them and runs the same queries again.
+
+    python -m benchmarks.reports_indexes --years 5 --reports-per-day 40
+"""
+import argparse
+import asyncio
+import json
+from datetime import date, timedelta
+
+import asyncpg
+
+from src.config import settings
+
+SCHEMA = "bench_reports"
+
+DDL = f"""
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+CREATE TABLE {SCHEMA}.places (
+    id SERIAL PRIMARY KEY,
+    title VARCHAR NOT NULL,
+    chat_id BIGINT UNIQUE
+);
+CREATE TABLE {SCHEMA}.employees (
+    id SERIAL PRIMARY KEY,
+    fullname VARCHAR NOT NULL,
+    username VARCHAR NOT NULL,
+    role VARCHAR NOT NULL,
+    user_id BIGINT UNIQUE,
+    created_at DATE NOT NULL DEFAULT current_date
+);
+CREATE TABLE {SCHEMA}.reports (
+    id SERIAL PRIMARY KEY,
+    report_date DATE NOT NULL,
+    visitors INTEGER NOT NULL,
+    revenue FLOAT NOT NULL,
+    place_id INTEGER REFERENCES {SCHEMA}.places (id) ON DELETE SET NULL,
+    user_id INTEGER REFERENCES {SCHEMA}.employees (id) ON DELETE SET NULL
+);
+"""
+
+FILL = f"""
+INSERT INTO {SCHEMA}.places (title, chat_id)
+SELECT 'Точка ' || i, -1000000000 - i FROM generate_series(1, $1) AS i;
+
+INSERT INTO {SCHEMA}.employees (fullname, username, role, user_id)
+SELECT 'Сотрудник ' || i, '@user' || i, CASE WHEN i % 20 = 0 THEN 'admin' ELSE 'employee' END, 100000 + i
+FROM generate_series(1, $2) AS i;
+
+INSERT INTO {SCHEMA}.reports (report_date, visitors, revenue, place_id, user_id)
+SELECT d::date, (random() * 200)::int, (random() * 100000)::numeric(12, 2),
+       1 + (random() * ($1 - 1))::int, 1 + (random() * ($2 - 1))::int
+FROM generate_series($3::date, $4::date, interval '1 day') AS d,
+     generate_series(1, $5) AS n;
+"""
+
+INDEXES = f"""
+CREATE INDEX ix_reports_place_id_report_date ON {SCHEMA}.reports (place_id, report_date);
+CREATE INDEX ix_reports_user_id_report_date ON {SCHEMA}.reports (user_id, report_date);
+CREATE UNIQUE INDEX ix_places_title ON {SCHEMA}.places (title);
+CREATE INDEX ix_employees_role ON {SCHEMA}.employees (role);
+"""
+
+QUERIES = {
+    # AsyncOrm.set_data_to_finances_by_place
+    "revenue of one place for N days": (
+        f"SELECT place_id, sum(revenue) FROM {SCHEMA}.reports "
+        f"WHERE report_date BETWEEN $1 AND $2 AND place_id = 7 GROUP BY place_id"
+    ),
+    # отчеты одного сотрудника за период
+    "reports of one employee for N days": (
+        f"SELECT count(*), sum(visitors) FROM {SCHEMA}.reports "
+        f"WHERE report_date BETWEEN $1 AND $2 AND user_id = 13"
+    ),
+    # AsyncOrm.set_data_to_reports / delete_place
+    "place id by title": (
+        f"SELECT id FROM {SCHEMA}.places WHERE title = 'Точка 7' AND $1::date IS NOT NULL AND $2::date IS NOT NULL"
+    ),
+    # AsyncOrm.get_employees / get_admins
+    "admins by role": (
+        f"SELECT fullname, username FROM {SCHEMA}.employees "
+        f"WHERE role = 'admin' AND $1::date IS NOT NULL AND $2::date IS NOT NULL"
+    ),
+}
+
+
+async def explain(connection: asyncpg.Connection, date_from: date, date_to: date, repeat: int):
+    results = {}
+
+    for name, query in QUERIES.items():
+        timings, node = [], None
+
+        for _ in range(repeat):
+            plan = json.loads(await connection.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", date_from, date_to))
+            timings.append(plan[0]["Execution Time"])
+            node = plan[0]["Plan"]
+
+            while node.get("Plans") and node["Node Type"] in ("Aggregate", "GroupAggregate", "HashAggregate"):
+                node = node["Plans"][0]
+
+        results[name] = (min(timings), node["Node Type"])
+
+    return results
+
+
+async def main(places: int, employees: int, years: int, reports_per_day: int, days: int, repeat: int):
+    connection = await asyncpg.connect(settings.get_dsn_asyncpg)
+
+    try:
+        date_to = date.today()
+        date_from = date_to - timedelta(days=365 * years)
+
+        await connection.execute(DDL)
+        await connection.execute(FILL.split(";")[0], places)
+        await connection.execute(FILL.split(";")[1], employees)
+        await connection.execute(FILL.split(";")[2], places, employees, date_from, date_to, reports_per_day)
+        await connection.execute(f"ANALYZE {SCHEMA}.places; ANALYZE {SCHEMA}.employees; ANALYZE {SCHEMA}.reports;")
+
+        total = await connection.fetchval(f"SELECT count(*) FROM {SCHEMA}.reports")
+        print(f"reports: {total}, places: {places}, employees: {employees}, window: {days} days\n")
+
+        window = (date_to - timedelta(days=days), date_to)
+        before = await explain(connection, *window, repeat=repeat)
+
+        await connection.execute(INDEXES)
+        await connection.execute(f"ANALYZE {SCHEMA}.places; ANALYZE {SCHEMA}.employees; ANALYZE {SCHEMA}.reports;")
+        after = await explain(connection, *window, repeat=repeat)
+
+        print(f"{'query':<40}{'before, ms':>12}{'after, ms':>12}  plan (before -> after)")
+        for name in QUERIES:
+            (time_before, plan_before), (time_after, plan_after) = before[name], after[name]
+            print(f"{name:<40}{time_before:>12.3f}{time_after:>12.3f}  {plan_before} -> {plan_after}")
+    finally:
+        await connection.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--places", type=int, default=40)
+    parser.add_argument("--employees", type=int, default=300)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--reports-per-day", type=int, default=40)
+    parser.add_argument("--days", type=int, default=settings.DAYS_FOR_FINANCES_CHECK)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.places, args.employees, args.years, args.reports_per_day, args.days, args.repeat))
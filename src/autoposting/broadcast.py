@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+# бот не может удалять сообщения старше 48 часов, хранить их id дольше незачем
+_MESSAGES_TTL_SECONDS = 48 * 60 * 60
+
+
+class BroadcastStats(NamedTuple):
+    recipients: int
+    sent: int
+    blocked: int  # сотрудник заблокировал бота или удалил чат
+    failed: int
+    deleted: int  # удалено старых сообщений этой рассылки
+    seconds: float
+
+
+class Broadcaster:
+    """
+    Рассылка одного сообщения многим получателям.
+
+    Сообщения отправляются параллельно, не больше concurrency одновременно;
+    общую скорость и повторы после flood control обеспечивает RateLimitMiddleware
+    сессии бота. id отправленных сообщений хранятся в Redis в хеше
+    broadcast:<name>:messages (user_id -> message_id), поэтому при следующей
+    рассылке с тем же именем старые сообщения удаляются пачкой,
+    в том числе после перезапуска бота.
+    """
+
+    def __init__(self, redis: Redis, concurrency: int = 30, prefix: str = "broadcast"):
+        self._redis = redis
+        self.concurrency = concurrency
+        self._prefix = prefix
+
+    def _key(self, name: str) -> str:
+        return f"{self._prefix}:{name}:messages"
+
+    async def send(
+            self,
+            bot: Bot,
+            name: str,
+            user_ids: Iterable[int],
+            text: str,
+            parse_mode: Optional[str] = "html",
+            replace_previous: bool = True,
+    ) -> BroadcastStats:
+        started = time.perf_counter()
+        user_ids = list(dict.fromkeys(user_ids))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        sent: Dict[int, int] = {}
+        blocked = failed = 0
+
+        async def send_one(user_id: int) -> None:
+            nonlocal blocked, failed
+
+            async with semaphore:
+                try:
+                    message = await bot.send_message(chat_id=user_id, text=text, parse_mode=parse_mode)
+                except TelegramForbiddenError:
+                    blocked += 1
+                except TelegramAPIError as e:
+                    failed += 1
+                    logger.warning("Рассылка %s: не удалось отправить пользователю %s: %s", name, user_id, e)
+                else:
+                    sent[user_id] = message.message_id
+
+        previous = await self._redis.hgetall(self._key(name)) if replace_previous else {}
+        await asyncio.gather(*(send_one(user_id) for user_id in user_ids))
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            if replace_previous:
+                pipe.delete(self._key(name))
+            if sent:
+                pipe.hset(self._key(name), mapping=sent)
+                pipe.expire(self._key(name), _MESSAGES_TTL_SECONDS)
+            await pipe.execute()
+
+        deleted = await self._delete_messages(bot, previous, semaphore)
+
+        stats = BroadcastStats(
+            recipients=len(user_ids),
+            sent=len(sent),
+            blocked=blocked,
+            failed=failed,
+            deleted=deleted,
+            seconds=round(time.perf_counter() - started, 3),
+        )
+        logger.info("Рассылка %s: %s", name, stats)
+        return stats
+
+    async def delete(self, bot: Bot, name: str) -> int:
+        """Удаляет у всех получателей сообщения последней рассылки name."""
+        key = self._key(name)
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(key)
+            pipe.delete(key)
+            messages, _ = await pipe.execute()
+
+        return await self._delete_messages(bot, messages, asyncio.Semaphore(self.concurrency))
+
+    @staticmethod
+    async def _delete_messages(bot: Bot, messages: Dict, semaphore: asyncio.Semaphore) -> int:
+        async def delete_one(user_id, message_id) -> bool:
+            async with semaphore:
+                try:
+                    return await bot.delete_message(chat_id=int(user_id), message_id=int(message_id))
+                except TelegramAPIError:
+                    # сообщение уже удалено сотрудником или слишком старое
+                    return False
+
+        results = await asyncio.gather(*(delete_one(*item) for item in messages.items()))
+        return sum(results)
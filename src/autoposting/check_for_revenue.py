@@ -1,56 +1,80 @@
 from datetime import datetime, timezone, timedelta
 from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
 
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.autoposting.history import PlaceRun
 from src.config import settings
+from src.database import async_session
 from src.db.queries.dao.dao import AsyncOrm
-import asyncio
 
 
-def creating_new_loop_for_checking_revenue(global_loop, bot: Bot):
-    asyncio.run_coroutine_threadsafe(send_revenue_report_by_N_days(bot), global_loop)
+async def send_revenue_report_by_N_days(bot: Bot):
+    # запускается планировщиком по расписанию settings.REVENUE_CHECK_CRON,
+    # одна сессия на всю проверку вместо отдельной на каждый запрос
+    async with async_session() as session:
+        await check_revenue(bot, session)
 
 
-async def send_revenue_report_by_N_days(bot: Bot):
-    while True:
+async def check_revenue(bot: Bot, session: AsyncSession):
+    date_now = datetime.now(tz=timezone(timedelta(hours=3.0))).date()
+
+    # один запрос находит все точки, у которых подошел срок сверки
+    due_places = await AsyncOrm.get_due_finance_places(session=session)
+    await session.commit()
+
+    failed = []
+    for place_id, title in due_places:
+        # сверка точки коммитится только вместе с отправкой отчета: если отправить
+        # не удалось, точка остается в сроке и догоняющий запуск отправит ее снова.
+        # Отправка по каждой точке попадает в job_runs; ошибка одной точки
+        # не мешает остальным, но весь запуск помечается неудачным
+        row = await AsyncOrm.rotate_due_finances(place_id=place_id, session=session)
+        if row is None:
+            # точку уже сверил другой процесс
+            await session.commit()
+            continue
+
         try:
-            date_now = datetime.now(tz=timezone(timedelta(hours=3.0))).date()
-            how_many_days_ago_on_places = [
-                (place_id, (date_now - last_update_date).days) for place_id, last_update_date in await AsyncOrm._check_data_from_finances()
-            ]
+            async with PlaceRun(session, title):
+                try:
+                    await bot.send_message(
+                        chat_id=settings.REVENUE_CHAT_ID,  # chat-id группы, куда бот будет присылать отчеты по выручке
+                        text=_revenue_report(row, date_now),
+                        parse_mode="html",
+                    )
+                except TelegramAPIError:
+                    await session.rollback()
+                    raise
 
-            for place_id, days_difference in how_many_days_ago_on_places:
-                if days_difference >= settings.DAYS_FOR_FINANCES_CHECK:
-                    await AsyncOrm.set_data_to_finances_by_place(place_id=place_id)
+                await session.commit()
+        except TelegramAPIError:
+            failed.append(title)
 
-                    data = await AsyncOrm.get_data_from_finances_by_place(place_id=place_id)
+    if failed:
+        raise RuntimeError(f"Не отправлены отчеты по выручке: {', '.join(failed)}")
 
-                    for title, _, last_money, updated_money, updated_at in data:
-                        chat_id = settings.REVENUE_CHAT_ID  # chat-id группы, куда бот будет присылать отчеты по выручке
-                        difference = updated_money - last_money
-                        last_money = f"{int(last_money):,}".replace(",", " ")
-                        updated_money = f"{int(updated_money):,}".replace(",", " ")
 
-                        report: str = "📊Статистика по росту выручки\n"
-                        report += f"<b>от</b> {updated_at.strftime('%d.%m.%y')} <b>до</b> {date_now.strftime('%d.%m.%y')}\n\n"
+def _revenue_report(row, date_now) -> str:
+    title, _, last_money, updated_money, updated_at = row
+    difference = updated_money - last_money
+    last_money = f"{int(last_money):,}".replace(",", " ")
+    updated_money = f"{int(updated_money):,}".replace(",", " ")
 
-                        report += f"🏚Точка: <b>{title}</b>\n└"
-                        report += f"Выручка {updated_at.strftime('%d.%m.%y')}: <em><b>{last_money}₽</b></em>\n└"
-                        report += f"Выручка {date_now.strftime('%d.%m.%y')}: <em><b>{updated_money}₽</b></em>\n\n"
+    report: str = "📊Статистика по росту выручки\n"
+    report += f"<b>от</b> {updated_at.strftime('%d.%m.%y')} <b>до</b> {date_now.strftime('%d.%m.%y')}\n\n"
 
-                        is_normal = True if difference > 0 else False
+    report += f"🏚Точка: <b>{title}</b>\n└"
+    report += f"Выручка {updated_at.strftime('%d.%m.%y')}: <em><b>{last_money}₽</b></em>\n└"
+    report += f"Выручка {date_now.strftime('%d.%m.%y')}: <em><b>{updated_money}₽</b></em>\n\n"
 
-                        difference = f"{int(difference):,}".replace(",", " ")
-                        report += f"Разница составила: <em><b>{difference}₽</b></em> "
+    is_normal = True if difference > 0 else False
 
-                        report += f"{'🟢' if is_normal else '🔴'}\n\n"
-                        report += f"Результат: <em>{'все в норме✅' if is_normal else 'нужно смотреть камеры⚠️'}</em>"
+    difference = f"{int(difference):,}".replace(",", " ")
+    report += f"Разница составила: <em><b>{difference}₽</b></em> "
 
-                        await bot.send_message(
-                            chat_id=chat_id,
-                            text=report,
-                            parse_mode="html",
-                        )
+    report += f"{'🟢' if is_normal else '🔴'}\n\n"
+    report += f"Результат: <em>{'все в норме✅' if is_normal else 'нужно смотреть камеры⚠️'}</em>"
 
-            await asyncio.sleep(60 * 60)  # спим 1 час
-        except Exception:
-            await asyncio.sleep(60 * 60)  # спим 1 час
+    return report
@@ -0,0 +1,93 @@
+import logging
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.db.queries.dao.dao import AsyncOrm
+
+logger = logging.getLogger(__name__)
+
+# id строки job_runs текущего запуска; задача видит его в своем asyncio.Task
+current_run_id: ContextVar[Optional[int]] = ContextVar("current_run_id", default=None)
+
+
+class JobHistory:
+    """
+    История запусков фоновых задач в таблице job_runs: время по расписанию,
+    начало, конец, длительность и результат. Ошибки записи истории только
+    логируются - из-за недоступной БД задача не должна пропускать запуск.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker[AsyncSession]):
+        self._session_pool = session_pool
+
+    async def last_runs(self) -> Dict[str, datetime]:
+        try:
+            async with self._session_pool() as session:
+                return await AsyncOrm.get_last_job_runs(session=session)
+        except Exception:
+            logger.exception("Не удалось прочитать историю запусков задач")
+            return {}
+
+    async def started(self, job_name: str, scheduled_at: datetime) -> Optional[int]:
+        try:
+            async with self._session_pool() as session:
+                run_id = await AsyncOrm.start_job_run(job_name, scheduled_at, session=session)
+                await session.commit()
+        except Exception:
+            logger.exception("Не удалось записать запуск задачи %s", job_name)
+            return None
+
+        current_run_id.set(run_id)
+        return run_id
+
+    async def finished(self, run_id: Optional[int], error: Optional[BaseException] = None) -> None:
+        if run_id is None:
+            return
+
+        try:
+            async with self._session_pool() as session:
+                await AsyncOrm.finish_job_run(run_id, error=None if error is None else repr(error), session=session)
+                await session.commit()
+        except Exception:
+            logger.exception("Не удалось записать результат запуска %s", run_id)
+
+
+class PlaceRun:
+    """
+    Запись об обработке одной точки в текущем запуске задачи:
+
+        async with PlaceRun(session, title):
+            ...  # отправка отчета по точке
+    """
+
+    def __init__(self, session: AsyncSession, place: str):
+        self._session = session
+        self._place = place
+
+    async def __aenter__(self) -> "PlaceRun":
+        self._started_at = datetime.now(tz=timezone.utc)
+        self._started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        run_id = current_run_id.get()
+        if run_id is None:
+            return
+
+        try:
+            await AsyncOrm.add_place_job_run(
+                parent_id=run_id,
+                place=self._place,
+                started_at=self._started_at,
+                duration_ms=int((time.perf_counter() - self._started) * 1000),
+                error=None if exc is None else repr(exc),
+                session=self._session,
+            )
+            await self._session.commit()
+        except Exception:
+            logger.exception("Не удалось записать обработку точки %s", self._place)
+            await self._session.rollback()
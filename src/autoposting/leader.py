@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from datetime import datetime
+from uuid import uuid4
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# продлеваем и отпускаем аренду, только если она все еще наша
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """
+    Выбор ведущего процесса для фоновых задач, когда запущено несколько копий бота.
+
+    Ведущий держит ключ leader:<name> (SET NX PX со своим id) и продлевает его
+    каждую треть ttl. Если ведущий умер, ключ истекает через ttl, и его забирает
+    другая копия. Ведущим процесс считает себя только до момента, когда его
+    аренда гарантированно не истекла в Redis, поэтому двух ведущих одновременно не бывает.
+    При штатной остановке аренда отпускается сразу.
+
+    Дополнительно claim() отмечает в Redis каждый запуск задачи по расписанию,
+    чтобы новый ведущий не повторил запуск, который успел выполнить старый.
+    """
+
+    def __init__(self, redis: Redis, name: str = "scheduler", ttl_seconds: float = 15.0):
+        self._redis = redis
+        self._key = f"leader:{name}"
+        self._runs_prefix = f"leader:{name}:runs"
+        self._id = uuid4().hex
+        self._ttl_ms = int(ttl_seconds * 1000)
+        self._renew_interval = ttl_seconds / 3
+        self._renew_script = redis.register_script(_RENEW_SCRIPT)
+        self._release_script = redis.register_script(_RELEASE_SCRIPT)
+        self._valid_until = 0.0
+        self._elected = asyncio.Event()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._valid_until > asyncio.get_running_loop().time()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        try:
+            while True:
+                started = loop.time()
+
+                try:
+                    if self._elected.is_set():
+                        acquired = await self._renew_script(keys=[self._key], args=[self._id, self._ttl_ms])
+                    else:
+                        acquired = await self._redis.set(self._key, self._id, nx=True, px=self._ttl_ms)
+                except RedisError:
+                    # Redis недоступен: остаемся ведущим, пока не истечет уже полученная аренда
+                    logger.exception("Не удалось обновить аренду %s", self._key)
+                else:
+                    if acquired:
+                        # отсчитываем от отправки запроса, а не от ответа
+                        self._valid_until = started + self._ttl_ms / 1000
+                    else:
+                        # ключ истек или его занял другой процесс
+                        self._valid_until = 0.0
+
+                if self.is_leader and not self._elected.is_set():
+                    logger.warning("Процесс %s стал ведущим (%s)", self._id, self._key)
+                    self._elected.set()
+                elif not self.is_leader and self._elected.is_set():
+                    logger.warning("Процесс %s больше не ведущий (%s)", self._id, self._key)
+                    self._elected.clear()
+
+                await asyncio.sleep(self._renew_interval)
+        finally:
+            await self._release()
+
+    async def _release(self) -> None:
+        if not self._elected.is_set():
+            return
+
+        self._valid_until = 0.0
+        self._elected.clear()
+
+        try:
+            await self._release_script(keys=[self._key], args=[self._id])
+        except RedisError:
+            logger.exception("Не удалось отпустить аренду %s", self._key)
+
+    async def claim(self, job_name: str, scheduled: datetime, timeout: float) -> bool:
+        """
+        Ждет не дольше timeout, пока процесс станет ведущим, и занимает запуск
+        job_name на время scheduled. False - запуск выполняет (или выполнил) другой процесс.
+        """
+        if not self.is_leader:
+            try:
+                await asyncio.wait_for(self._elected.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return False
+
+            if not self.is_leader:
+                return False
+
+        try:
+            return bool(await self._redis.set(
+                f"{self._runs_prefix}:{job_name}:{scheduled.isoformat()}", self._id, nx=True, ex=24 * 60 * 60,
+            ))
+        except RedisError:
+            logger.exception("Не удалось занять запуск %s на %s", job_name, scheduled)
+            return False
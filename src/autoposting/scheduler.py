@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, tzinfo
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Set
+from zoneinfo import ZoneInfo
+
+from src.autoposting.history import JobHistory
+from src.autoposting.leader import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+
+# что делать с запуском, время которого прошло, пока процесс спал или был занят
+MISSED_RUN_ONCE = "run_once"  # выполнить один раз, сколько бы запусков ни пропустили
+MISSED_SKIP = "skip"  # пропустить и ждать следующего запуска по расписанию
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+
+    for part in field.split(","):
+        value, _, step = part.partition("/")
+        step = int(step) if step else 1
+
+        if value == "*":
+            start, end = low, high
+        elif "-" in value:
+            start, end = (int(x) for x in value.split("-"))
+        else:
+            start = int(value)
+            end = high if step > 1 else start
+
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field out of range {low}-{high}: {field}")
+
+        values.update(range(start, end + 1, step))
+
+    return frozenset(values)
+
+
+class CronTrigger:
+    """
+    Расписание в формате cron из пяти полей: минута, час, день месяца,
+    месяц, день недели (0 - воскресенье). Время считается в часовом поясе tz,
+    следующее срабатывание вычисляется точно, без периодических проверок.
+
+        CronTrigger("0 16 * * *")  # каждый день в 16:00 по Москве
+    """
+
+    def __init__(self, expression: str, tz: tzinfo = MOSCOW_TZ):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression}")
+
+        self.expression = expression
+        self.tz = tz
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        self.weekdays = frozenset(day % 7 for day in _parse_cron_field(fields[4], 0, 7))
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+
+        # как в cron: если заданы оба поля, достаточно совпадения любого
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_fire_time(self, after: datetime) -> datetime:
+        # перебираем по крупным шагам: месяц, день, час, минута
+        moment = after.astimezone(self.tz).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.replace(tzinfo=self.tz)
+
+        raise ValueError(f"Cron expression never fires: {self.expression}")
+
+    def __repr__(self) -> str:
+        return f"CronTrigger({self.expression!r})"
+
+
+class IntervalTrigger:
+    """Срабатывает каждые seconds секунд, считая от предыдущего запуска по расписанию."""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Interval must be positive")
+        self.interval = timedelta(seconds=seconds)
+
+    def next_fire_time(self, after: datetime) -> datetime:
+        return after + self.interval
+
+    def __repr__(self) -> str:
+        return f"IntervalTrigger({self.interval.total_seconds()})"
+
+
+class Job:
+    __slots__ = (
+        "name", "func", "trigger", "jitter_seconds", "missed_policy",
+        "misfire_grace_seconds", "next_run_at", "running",
+    )
+
+    def __init__(
+            self,
+            name: str,
+            func: Callable[[], Awaitable[None]],
+            trigger,
+            jitter_seconds: float,
+            missed_policy: str,
+            misfire_grace_seconds: float,
+    ):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.jitter_seconds = jitter_seconds
+        self.missed_policy = missed_policy
+        self.misfire_grace_seconds = misfire_grace_seconds
+        self.next_run_at: Optional[datetime] = None  # время по расписанию, без jitter
+        self.running = False
+
+    def run_at(self) -> datetime:
+        return self.next_run_at + timedelta(seconds=random.uniform(0, self.jitter_seconds))
+
+
+class Scheduler:
+    """
+    Планировщик фоновых задач внутри event loop бота (вместо потоков,
+    которые раз в час проверяли время).
+
+    Между запусками планировщик спит ровно до ближайшего срабатывания.
+    У каждой задачи:
+    - jitter - случайная задержка запуска, чтобы задачи нескольких процессов
+      и внешние сервисы не получали нагрузку в одну и ту же секунду;
+    - missed_policy - что делать, если время запуска прошло больше чем на
+      misfire_grace_seconds (процесс был занят или усыплен): MISSED_RUN_ONCE
+      выполняет задачу один раз, MISSED_SKIP пропускает запуск;
+    - защита от наложения: пока предыдущий запуск не закончился, новый не стартует.
+
+    Если передан leader, задачи выполняются только в ведущем процессе:
+    остальные копии бота ждут, не станут ли они ведущими в пределах
+    misfire_grace_seconds, и пропускают запуски, которые уже занял ведущий.
+
+    Если передан history, каждый запуск записывается в job_runs, а при старте
+    планировщик находит запуски, пропущенные пока бот не работал, и выполняет
+    каждую такую задачу один раз сразу (с учетом ее missed_policy).
+    """
+
+    def __init__(
+            self,
+            tz: tzinfo = MOSCOW_TZ,
+            leader: Optional[LeaderLease] = None,
+            history: Optional[JobHistory] = None,
+    ):
+        self.tz = tz
+        self._leader = leader
+        self._history = history
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._changed: Optional[asyncio.Event] = None
+
+    def add_job(
+            self,
+            name: str,
+            func: Callable[[], Awaitable[None]],
+            trigger,
+            jitter_seconds: float = 0.0,
+            missed_policy: str = MISSED_RUN_ONCE,
+            misfire_grace_seconds: float = 60.0,
+    ) -> Job:
+        if missed_policy not in (MISSED_RUN_ONCE, MISSED_SKIP):
+            raise ValueError(f"Unknown missed run policy: {missed_policy}")
+        if name in self._jobs:
+            raise ValueError(f"Job already exists: {name}")
+
+        job = self._jobs[name] = Job(name, func, trigger, jitter_seconds, missed_policy, misfire_grace_seconds)
+
+        if self._changed is not None:
+            job.next_run_at = job.trigger.next_fire_time(self.now())
+            self._changed.set()
+
+        return job
+
+    def jobs(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def now(self) -> datetime:
+        return datetime.now(tz=self.tz)
+
+    async def run(self) -> None:
+        self._changed = asyncio.Event()
+        now = self.now()
+
+        last_runs = await self._history.last_runs() if self._history is not None else {}
+
+        for job in self._jobs.values():
+            job.next_run_at = job.trigger.next_fire_time(now)
+
+            # пропущенные запуски догоняем одним запуском на время последнего из них
+            last_run = last_runs.get(job.name)
+            if last_run is not None:
+                missed = self._last_missed_run(job, last_run, now)
+                if missed is not None:
+                    logger.warning("Задача %s пропустила запуск %s, пока бот не работал", job.name, missed)
+                    job.next_run_at = missed
+
+        # время запуска с учетом jitter фиксируем один раз на срабатывание
+        run_at: Dict[str, datetime] = {}
+
+        try:
+            while True:
+                for job in self._jobs.values():
+                    if job.name not in run_at:
+                        run_at[job.name] = job.run_at()
+
+                job = min(self._jobs.values(), key=lambda j: run_at[j.name], default=None)
+                timeout = None if job is None else (run_at[job.name] - self.now()).total_seconds()
+
+                if timeout is None or timeout > 0:
+                    # спим до ближайшего запуска или до добавления новой задачи;
+                    # после пробуждения расписание пересчитывается по текущим часам
+                    self._changed.clear()
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                del run_at[job.name]
+                self._fire(job, self.now())
+        finally:
+            self._changed = None
+            for task in self._tasks:
+                task.cancel()
+
+    @staticmethod
+    def _last_missed_run(job: Job, last_run: datetime, now: datetime) -> Optional[datetime]:
+        missed = None
+        fire_time = job.trigger.next_fire_time(last_run)
+
+        # ограничение на случай очень частого расписания и долгого простоя
+        for _ in range(100_000):
+            if fire_time > now:
+                break
+            missed, fire_time = fire_time, job.trigger.next_fire_time(fire_time)
+
+        return missed
+
+    def _fire(self, job: Job, now: datetime) -> None:
+        scheduled = job.next_run_at
+        late = (now - scheduled).total_seconds() - job.jitter_seconds
+
+        # следующий запуск - первый по расписанию после текущего момента,
+        # так что пропущенные запуски не выполняются пачкой
+        job.next_run_at = job.trigger.next_fire_time(max(now, scheduled))
+
+        if late > job.misfire_grace_seconds and job.missed_policy == MISSED_SKIP:
+            logger.warning("Задача %s пропущена: опоздание %.0f с", job.name, late)
+            return
+
+        if job.running:
+            logger.warning("Задача %s еще выполняется, запуск на %s пропущен", job.name, scheduled)
+            return
+
+        task = asyncio.create_task(self._run_job(job, scheduled))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_job(self, job: Job, scheduled: datetime) -> None:
+        job.running = True
+        try:
+            if self._leader is not None and not await self._leader.claim(
+                    job.name, scheduled, timeout=job.misfire_grace_seconds,
+            ):
+                return
+
+            run_id = await self._history.started(job.name, scheduled) if self._history is not None else None
+            error = None
+
+            try:
+                await job.func()
+            except Exception as e:
+                logger.exception("Ошибка в задаче %s", job.name)
+                error = e
+
+            if self._history is not None:
+                await self._history.finished(run_id, error)
+        finally:
+            job.running = False
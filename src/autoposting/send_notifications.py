@@ -1,48 +1,25 @@
-from datetime import datetime, timezone, timedelta
-
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest
 
-from src.db import cached_employees
+from src.autoposting.broadcast import Broadcaster
+from src.config import settings, redis
+from src.db import directory
 from src.lexicon.lexicon_ru import NOTIFICATION
-import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
-
-def creating_new_loop_for_notification(global_loop, bot: Bot):
-    asyncio.run_coroutine_threadsafe(auto_posting(bot), global_loop)
+broadcaster = Broadcaster(redis=redis, concurrency=settings.BROADCAST_CONCURRENCY)
 
 
 async def auto_posting(bot: Bot):
-    last_message = None
-
-    while True:
-        if datetime.now(tz=timezone(timedelta(hours=3.0))).hour == 16:
-            user_ids = cached_employees
-
-            if not user_ids:
-                await asyncio.sleep(60 * 60)  # спим час
-
-            for user_id in user_ids:
-                try:
-                    message = await bot.send_message(
-                        chat_id=user_id,
-                        text=NOTIFICATION,
-                        parse_mode="html",
-                    )
-
-                    if last_message is not None:
-                        await bot.delete_message(
-                            chat_id=last_message.chat.id,
-                            message_id=last_message.message_id,
-                        )
-
-                    last_message = message
-
-                    await asyncio.sleep(60 * 60)  # спим час
-                except (Exception, TelegramBadRequest):
-                    pass
-        else:
-            await asyncio.sleep(60 * 60)  # спим час
+    # запускается планировщиком по расписанию settings.NOTIFICATION_CRON;
+    # вчерашнее напоминание у каждого сотрудника заменяется сегодняшним
+    stats = await broadcaster.send(
+        bot,
+        name="daily_checking",
+        user_ids=directory.user_ids(role="employee"),
+        text=NOTIFICATION,
+    )
+
+    if stats.failed:
+        logger.warning("Напоминание о дневной сверке доставлено не всем: %s", stats)
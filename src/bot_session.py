@@ -0,0 +1,90 @@
+import asyncio
+import json
+import logging
+import ssl
+from typing import Optional
+
+import certifi
+from aiogram import __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _json_codec():
+    if settings.TG_USE_ORJSON:
+        try:
+            import orjson
+        except ImportError:
+            logger.warning("TG_USE_ORJSON включен, но orjson не установлен - используется json")
+        else:
+            # aiogram ждет от json_dumps строку, а orjson отдает bytes
+            return orjson.loads, lambda value: orjson.dumps(value).decode()
+
+    return json.loads, json.dumps
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    AiohttpSession со своим TCPConnector: размер пула, время жизни keep-alive
+    соединения и кэш DNS задаются явно. HTTP-сессию создает и закрывает
+    сам класс, не трогая внутренние атрибуты AiohttpSession.
+    """
+
+    def __init__(self, limit: int, keepalive_timeout: float, ttl_dns_cache: int, **kwargs):
+        super().__init__(**kwargs)
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self._client: Optional[ClientSession] = None
+
+    async def create_session(self) -> ClientSession:
+        if self._client is None or self._client.closed:
+            self._client = ClientSession(
+                connector=TCPConnector(
+                    ssl=ssl.create_default_context(cafile=certifi.where()),
+                    limit=self.limit,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=self.ttl_dns_cache,
+                ),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+            )
+
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None and not self._client.closed:
+            await self._client.close()
+
+            # как и AiohttpSession, даем SSL-соединениям закрыться
+            await asyncio.sleep(0.25)
+
+
+def create_bot_session() -> AiohttpSession:
+    """
+    Сессия Bot API с настройками из Settings: один пул keep-alive соединений
+    на весь процесс, кэш DNS и таймаут на запрос. Флоу отчетов делают
+    десятки запросов подряд, и каждый из них не должен заново открывать
+    TCP/TLS-соединение и резолвить api.telegram.org.
+    """
+    json_loads, json_dumps = _json_codec()
+
+    kwargs = {}
+    if settings.TG_API_SERVER:
+        kwargs["api"] = TelegramAPIServer.from_base(settings.TG_API_SERVER)
+
+    return TunedAiohttpSession(
+        limit=settings.TG_POOL_SIZE,
+        keepalive_timeout=settings.TG_KEEPALIVE_SECONDS,
+        ttl_dns_cache=settings.TG_DNS_CACHE_SECONDS,
+        json_loads=json_loads,
+        json_dumps=json_dumps,
+        timeout=settings.TG_REQUEST_TIMEOUT,
+        **kwargs,
+    )
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 from aiogram.fsm.storage.redis import Redis
 
@@ -15,14 +17,70 @@ class Settings(BaseSettings):
     DB_PASS: str
     DB_NAME: str
 
+    # пул соединений SQLAlchemy
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # размер кэша подготовленных выражений asyncpg на одно соединение
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500
+
+    # кэш имен сотрудников, которых уже нет в справочнике (см. NameCache)
+    NAME_CACHE_SIZE: int = 1024
+    NAME_CACHE_TTL: int = 60 * 60
+
+    # ограничения исходящих запросов к Telegram (см. RateLimitMiddleware)
+    TG_GLOBAL_RATE: float = 30.0
+    TG_PRIVATE_CHAT_RATE: float = 1.0
+    TG_PRIVATE_CHAT_BURST: float = 3.0
+    TG_GROUP_CHAT_RATE_PER_MINUTE: float = 20.0
+    # сколько сообщений можно отправить подряд без пауз (в одну группу и всего по боту)
+    TG_GROUP_CHAT_BURST: float = 1.0
+    TG_GLOBAL_BURST: float = 1.0
+    TG_MAX_RETRIES: int = 3
+
+    # HTTP-сессия Bot API (см. src/bot_session.py)
+    TG_REQUEST_TIMEOUT: float = 60.0
+    TG_POOL_SIZE: int = 100
+    TG_KEEPALIVE_SECONDS: float = 60.0
+    TG_DNS_CACHE_SECONDS: int = 300
+    TG_USE_ORJSON: bool = False
+    # свой Bot API сервер, например http://localhost:8081 (по умолчанию - api.telegram.org)
+    TG_API_SERVER: Optional[str] = None
+
     REDIS_HOST: str
 
+    # где собирать альбомы: "memory" - в процессе, "redis" - общий буфер для нескольких процессов
+    ALBUM_STORAGE: str = "memory"
+    # альбом собран, если ALBUM_QUIET_WINDOW_SECONDS не было новых фото, но не дольше ALBUM_WAIT_SECONDS
+    ALBUM_WAIT_SECONDS: float = 2.0
+    ALBUM_QUIET_WINDOW_SECONDS: float = 0.3
+    # как часто писать в лог размер буфера альбомов и число вытесненных альбомов
+    ALBUM_STATS_INTERVAL_SECONDS: float = 60 * 60
+
     DAYS_FOR_FINANCES_CHECK: int
 
+    # расписания фоновых задач в формате cron, время московское (см. src/autoposting/scheduler.py)
+    NOTIFICATION_CRON: str = "0 16 * * *"
+    REVENUE_CHECK_CRON: str = "0 0 * * *"
+    # случайная задержка запуска фоновых задач, секунды
+    SCHEDULER_JITTER_SECONDS: float = 30.0
+    # фоновые задачи выполняет одна копия бота; если она пропала, задачи
+    # переходят к другой не позже чем через столько секунд
+    SCHEDULER_LEADER_TTL_SECONDS: float = 15.0
+    # сколько сообщений рассылки отправляется одновременно (общий темп задает TG_GLOBAL_RATE)
+    BROADCAST_CONCURRENCY: int = 30
+
     @property
     def get_url_asyncpg(self):
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def get_dsn_asyncpg(self):
+        # DSN для "голого" asyncpg (без SQLAlchemy), например для LISTEN/NOTIFY
+        return f"postgresql://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
     class Config:
         env_file = "../.env"
 
@@ -1,11 +1,23 @@
-from src.config import settings
-from src.db.db import DataBase
+from src.config import settings, redis
+from src.db.cache import DirectoryCache
+from src.db.invalidation import DirectoryInvalidation
+from src.db.listener import DirectoryListener
+from src.db.names import NameCache
+from src.db.queries.dao.dao import AsyncOrm
 
-DB = DataBase(settings=settings)
+directory = DirectoryCache()
+names = NameCache(
+    directory=directory,
+    loader=AsyncOrm.get_current_name,
+    maxsize=settings.NAME_CACHE_SIZE,
+    ttl=settings.NAME_CACHE_TTL,
+)
 
-cached_places: dict = {title: chat_id for title, chat_id in DB.get_places()}
-cached_employees: list = DB.get_employees_user_ids()
-cached_admins: list = DB.get_admins_user_ids()
-cached_chat_ids: list = DB.get_chat_ids()
-cached_employees_fullname_and_id: list = DB.get_employees_fullname_and_id(role="employee")
-cached_admins_fullname_and_id: list = DB.get_employees_fullname_and_id(role="admin")
+
+async def load_cache() -> None:
+    rows = await AsyncOrm.get_directory()
+    directory.load(rows)
+
+
+directory_invalidation = DirectoryInvalidation(redis=redis, directory=directory, reload=load_cache)
+directory_listener = DirectoryListener(dsn=settings.get_dsn_asyncpg, directory=directory, reload=load_cache)
@@ -0,0 +1,177 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class CachedEmployee(NamedTuple):
+    role: str
+    fullname: str
+    username: Optional[str]
+
+
+class _Snapshot:
+    __slots__ = ("employees", "places", "chats")
+
+    def __init__(
+            self,
+            employees: Dict[int, CachedEmployee],
+            places: Dict[str, int],
+            chats: Dict[int, str],
+    ):
+        self.employees = employees  # user_id -> (role, fullname, username)
+        self.places = places  # title -> chat_id
+        self.chats = chats  # chat_id -> title
+
+
+class DirectoryCache:
+    """
+    Справочник точек, сотрудников и админов в памяти процесса.
+
+    Все индексы лежат в одном снимке (_Snapshot), который никогда не меняется
+    на месте: любое изменение собирает новый снимок и подменяет ссылку целиком,
+    поэтому фильтры и клавиатуры всегда видят согласованные данные.
+    """
+
+    def __init__(self):
+        self._snapshot = _Snapshot(employees={}, places={}, chats={})
+        self._listeners: List[Callable[[Dict[str, Any], bool], None]] = []
+
+    def add_listener(self, listener: Callable[[Dict[str, Any], bool], None]) -> None:
+        # listener(event, local) вызывается после каждого изменения справочника;
+        # local=False, если изменение пришло извне (другой процесс, БД)
+        self._listeners.append(listener)
+
+    def apply(self, event: Dict[str, Any], local: bool = True) -> None:
+        op = event["op"]
+
+        if op == "upsert_employee":
+            self._upsert_employee(event["user_id"], event["fullname"], event["username"], event["role"])
+        elif op == "remove_employee":
+            self._remove_employee(event["user_id"])
+        elif op == "upsert_place":
+            self._upsert_place(event["title"], event["chat_id"])
+        elif op == "remove_place":
+            self._remove_place(event["title"])
+        else:
+            raise ValueError(f"Unknown directory operation: {op}")
+
+        for listener in self._listeners:
+            listener(event, local)
+
+    def load(self, directory) -> None:
+        # directory - результат AsyncOrm.get_directory()
+        employees, places, chats = {}, {}, {}
+
+        for kind, name, ident, username in directory:
+            if kind == "place":
+                places[name] = int(ident)
+                chats[int(ident)] = name
+            else:
+                employees[int(ident)] = CachedEmployee(role=kind, fullname=name, username=username)
+
+        self._snapshot = _Snapshot(employees=employees, places=places, chats=chats)
+
+    # --- изменения ---
+
+    def upsert_employee(self, user_id: int, fullname: str, username: Optional[str], role: str) -> None:
+        self.apply({
+            "op": "upsert_employee",
+            "user_id": int(user_id),
+            "fullname": fullname,
+            "username": username,
+            "role": role,
+        })
+
+    def remove_employee(self, user_id: int) -> None:
+        self.apply({"op": "remove_employee", "user_id": int(user_id)})
+
+    def upsert_place(self, title: str, chat_id: int) -> None:
+        self.apply({"op": "upsert_place", "title": title, "chat_id": int(chat_id)})
+
+    def remove_place(self, title: str) -> None:
+        self.apply({"op": "remove_place", "title": title})
+
+    def _upsert_employee(self, user_id: int, fullname: str, username: Optional[str], role: str) -> None:
+        snapshot = self._snapshot
+        employees = dict(snapshot.employees)
+        employees[int(user_id)] = CachedEmployee(role=role, fullname=fullname, username=username)
+
+        self._snapshot = _Snapshot(employees=employees, places=snapshot.places, chats=snapshot.chats)
+
+    def _remove_employee(self, user_id: int) -> None:
+        snapshot = self._snapshot
+        if int(user_id) not in snapshot.employees:
+            return
+
+        employees = dict(snapshot.employees)
+        employees.pop(int(user_id))
+
+        self._snapshot = _Snapshot(employees=employees, places=snapshot.places, chats=snapshot.chats)
+
+    def _upsert_place(self, title: str, chat_id: int) -> None:
+        snapshot = self._snapshot
+        places, chats = dict(snapshot.places), dict(snapshot.chats)
+
+        # точка уникальна по chat_id (см. AsyncOrm.add_place), поэтому
+        # старое название этого чата нужно убрать из индекса
+        old_title = chats.get(int(chat_id))
+        if old_title is not None and places.get(old_title) == int(chat_id):
+            places.pop(old_title)
+
+        places[title] = int(chat_id)
+        chats[int(chat_id)] = title
+
+        self._snapshot = _Snapshot(employees=snapshot.employees, places=places, chats=chats)
+
+    def _remove_place(self, title: str) -> None:
+        snapshot = self._snapshot
+        if title not in snapshot.places:
+            return
+
+        places = dict(snapshot.places)
+        places.pop(title)
+
+        # AsyncOrm.delete_place удаляет все чаты с таким названием
+        chats = {chat_id: chat_title for chat_id, chat_title in snapshot.chats.items() if chat_title != title}
+
+        self._snapshot = _Snapshot(employees=snapshot.employees, places=places, chats=chats)
+
+    # --- чтение ---
+
+    def is_employee(self, user_id: int) -> bool:
+        employee = self._snapshot.employees.get(int(user_id))
+        return employee is not None and employee.role == "employee"
+
+    def is_admin(self, user_id: int) -> bool:
+        employee = self._snapshot.employees.get(int(user_id))
+        return employee is not None and employee.role == "admin"
+
+    def is_known_user(self, user_id: int) -> bool:
+        return int(user_id) in self._snapshot.employees
+
+    def is_place_chat(self, chat_id: int) -> bool:
+        return int(chat_id) in self._snapshot.chats
+
+    def get_chat_id(self, title: str) -> Optional[int]:
+        return self._snapshot.places.get(title)
+
+    def get_place(self, chat_id: int) -> Optional[str]:
+        return self._snapshot.chats.get(int(chat_id))
+
+    def get_employee(self, user_id: int) -> Optional[CachedEmployee]:
+        return self._snapshot.employees.get(int(user_id))
+
+    def places(self) -> List[Tuple[str, int]]:
+        return list(self._snapshot.places.items())
+
+    def fullnames_and_ids(self, role: str) -> List[Tuple[str, int]]:
+        return [
+            (employee.fullname, user_id)
+            for user_id, employee in self._snapshot.employees.items()
+            if employee.role == role
+        ]
+
+    def user_ids(self, role: str) -> List[int]:
+        return [
+            user_id
+            for user_id, employee in self._snapshot.employees.items()
+            if employee.role == role
+        ]
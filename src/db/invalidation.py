@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.db.cache import DirectoryCache
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "directory:changes"
+VERSION_KEY = "directory:version"
+
+# INCR и PUBLISH выполняются атомарно, поэтому порядок сообщений
+# в канале совпадает с порядком версий
+_PUBLISH_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+redis.call('PUBLISH', ARGV[1], version .. ':' .. ARGV[2])
+return version
+"""
+
+class _Deferred:
+    # изменения справочника за один апдейт (см. DirectoryInvalidation.publish_after)
+    __slots__ = ("pending", "committed")
+
+    def __init__(self):
+        self.pending: List[Dict[str, Any]] = []  # ждут коммита транзакции
+        self.committed: List[Dict[str, Any]] = []  # транзакция закоммичена, можно публиковать
+
+
+_deferred: ContextVar[Optional[_Deferred]] = ContextVar("directory_deferred_events", default=None)
+
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session: Session) -> None:
+    # хендлер может закоммитить сессию сам, до ответа в Telegram;
+    # SQLAlchemy выполняет этот обработчик в контексте вызвавшей коммит задачи
+    deferred = _deferred.get()
+    if deferred is not None and deferred.pending:
+        deferred.committed.extend(deferred.pending)
+        deferred.pending.clear()
+
+
+def _event_key(event: Dict[str, Any]) -> Tuple[str, Any]:
+    # события про одного сотрудника или одну точку упорядочиваются между собой
+    if event["op"] in ("upsert_employee", "remove_employee"):
+        return "employee", int(event["user_id"])
+    return "place", event["title"]
+
+
+class DirectoryInvalidation:
+    """
+    Рассылает изменения справочника другим процессам бота через Redis pub/sub
+    и применяет чужие изменения к локальному DirectoryCache.
+
+    Каждое событие получает версию из общего счетчика в Redis. Для каждого
+    сотрудника и каждой точки запоминается последняя примененная версия,
+    и события с меньшей версией пропускаются: свое изменение процесс применяет
+    сразу, а пришедшее позже чужое, но более старое событие его не перезапишет.
+    Если процесс видит пропуск версий (например, после обрыва соединения с Redis),
+    справочник перечитывается из БД целиком.
+    """
+
+    def __init__(self, redis: Redis, directory: DirectoryCache, reload: Callable[[], Awaitable[None]]):
+        self._redis = redis
+        self._directory = directory
+        self._reload = reload
+        self._publish_script = redis.register_script(_PUBLISH_SCRIPT)
+        self._publish_lock = asyncio.Lock()
+        self._last_version = 0
+        self._key_versions: Dict[Tuple[str, Any], int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        directory.add_listener(self._on_change)
+
+    async def start(self) -> asyncio.Task:
+        # подписываемся до загрузки справочника, чтобы не потерять
+        # изменения, сделанные другими процессами между загрузкой и подпиской
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(CHANNEL)
+        await self._sync()
+
+        return asyncio.create_task(self._listen(pubsub))
+
+    def _on_change(self, event: Dict[str, Any], local: bool) -> None:
+        # публикуем только изменения, сделанные в этом процессе
+        if not local:
+            return
+
+        deferred = _deferred.get()
+        if deferred is not None:
+            deferred.pending.append(event)
+            return
+
+        task = asyncio.get_running_loop().create_task(self._publish(event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @asynccontextmanager
+    async def publish_after(self) -> AsyncIterator[None]:
+        """
+        Откладывает публикацию изменений, сделанных внутри блока, до коммита
+        транзакции: изменения, после которых был коммит, публикуются при выходе
+        из блока, даже если дальше блок упал. Если блок упал до коммита
+        (транзакция откатилась), эти изменения не публикуются, а локальный
+        справочник перечитывается из БД.
+        """
+        deferred = _Deferred()
+        token = _deferred.set(deferred)
+
+        try:
+            yield
+        except Exception:
+            if deferred.pending:
+                try:
+                    await self._reload()
+                except Exception:
+                    logger.exception("Не удалось перечитать справочник после отката транзакции")
+            raise
+        else:
+            # изменения без транзакции БД (коммита не было) тоже публикуем
+            deferred.committed.extend(deferred.pending)
+        finally:
+            _deferred.reset(token)
+
+            for change in deferred.committed:
+                await self._publish(change)
+
+    async def _publish(self, event: Dict[str, Any]) -> None:
+        payload = json.dumps(event, ensure_ascii=False)
+
+        # версии своих изменений получаем в том же порядке, в каком они применены
+        async with self._publish_lock:
+            try:
+                version = await self._publish_script(keys=[VERSION_KEY], args=[CHANNEL, payload])
+            except RedisError:
+                logger.exception("Не удалось опубликовать изменение справочника: %s", event)
+                return
+
+        # _last_version здесь не трогаем, чтобы не пропустить чужие события
+        # с меньшей версией по другим ключам; по этому ключу они уже устарели
+        key = _event_key(event)
+        self._key_versions[key] = max(self._key_versions.get(key, 0), int(version))
+
+    async def _sync(self) -> None:
+        version = await self._redis.get(VERSION_KEY)
+        await self._reload()
+        self._last_version = int(version or 0)
+        self._key_versions.clear()
+
+    async def _listen(self, pubsub) -> None:
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        await self._handle(message["data"])
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception:
+                logger.exception("Ошибка в подписке на изменения справочника")
+
+            await pubsub.aclose()
+            await asyncio.sleep(5)
+
+            # после переподключения часть событий могла потеряться
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(CHANNEL)
+                await self._sync()
+            except Exception:
+                logger.exception("Не удалось переподписаться на изменения справочника")
+
+    async def _handle(self, data: bytes) -> None:
+        version, payload = data.decode("utf-8").split(":", 1)
+        version = int(version)
+        event: Dict[str, Any] = json.loads(payload)
+
+        if version <= self._last_version:
+            return
+
+        missed = version > self._last_version + 1
+        self._last_version = version
+
+        if missed:
+            await self._reload()
+            self._key_versions.clear()
+            return
+
+        key = _event_key(event)
+        if version < self._key_versions.get(key, 0):
+            return
+        self._key_versions[key] = version
+
+        # собственное событие тоже применяем: если до него успело прийти
+        # более старое чужое событие по тому же ключу, оно будет исправлено
+        self._directory.apply(event, local=False)
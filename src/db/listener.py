@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import asyncpg
+
+from src.db.cache import DirectoryCache
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "directory_changes"
+
+
+def _employee_events(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    events = []
+
+    if old is not None and (new is None or old["user_id"] != new["user_id"]):
+        events.append({"op": "remove_employee", "user_id": int(old["user_id"])})
+
+    if new is not None:
+        events.append({
+            "op": "upsert_employee",
+            "user_id": int(new["user_id"]),
+            "fullname": new["fullname"],
+            "username": new["username"],
+            "role": new["role"],
+        })
+
+    return events
+
+
+def _place_events(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    events = []
+
+    if old is not None and (new is None or (old["title"], old["chat_id"]) != (new["title"], new["chat_id"])):
+        events.append({"op": "remove_place", "title": old["title"]})
+
+    if new is not None:
+        events.append({"op": "upsert_place", "title": new["title"], "chat_id": int(new["chat_id"])})
+
+    return events
+
+
+class DirectoryListener:
+    """
+    Держит отдельное asyncpg-соединение с LISTEN directory_changes и применяет
+    построчные изменения employees/places (триггеры из миграции 7c1e5b9a0d43)
+    к DirectoryCache. Так справочник подхватывает правки, сделанные в БД
+    в обход бота, без перезапуска и без периодического перечитывания.
+
+    После каждого подключения (в том числе первого) справочник перечитывается
+    уже под LISTEN, поэтому изменения до подписки тоже не теряются.
+    """
+
+    def __init__(
+            self,
+            dsn: str,
+            directory: DirectoryCache,
+            reload: Callable[[], Awaitable[None]],
+            keepalive_seconds: float = 30.0,
+    ):
+        self._dsn = dsn
+        self._directory = directory
+        self._reload = reload
+        self._keepalive_seconds = keepalive_seconds
+
+    async def run(self) -> None:
+        while True:
+            try:
+                connection = await asyncpg.connect(self._dsn)
+            except (OSError, asyncpg.PostgresError):
+                logger.exception("Не удалось подключиться к БД для LISTEN %s", CHANNEL)
+                await asyncio.sleep(5)
+                continue
+
+            try:
+                await connection.add_listener(CHANNEL, self._on_notify)
+
+                # уведомления, отправленные до LISTEN (между загрузкой справочника
+                # при старте или пока соединения не было), потеряны - перечитываем
+                await self._reload()
+
+                # периодический запрос нужен, чтобы заметить "тихо" оборванное соединение
+                while not connection.is_closed():
+                    await asyncio.sleep(self._keepalive_seconds)
+                    await connection.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Соединение LISTEN %s оборвалось", CHANNEL)
+            finally:
+                if not connection.is_closed():
+                    await connection.close()
+
+            await asyncio.sleep(5)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            change = json.loads(payload)
+
+            if change["table"] == "employees":
+                events = _employee_events(change["old"], change["new"])
+            elif change["table"] == "places":
+                events = _place_events(change["old"], change["new"])
+            else:
+                return
+
+            for event in events:
+                self._directory.apply(event, local=False)
+        except Exception:
+            logger.exception("Не удалось применить изменение справочника из БД: %s", payload)
@@ -0,0 +1,42 @@
+from typing import Awaitable, Callable, Optional
+
+from cachetools import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.cache import DirectoryCache
+
+
+class NameCache:
+    """
+    Имена сотрудников (user_id -> fullname) для текстов отчетов.
+
+    Имена действующих сотрудников и админов берутся из DirectoryCache, который
+    уже следит за всеми изменениями справочника. Только если сотрудника там нет
+    (например, его удалили, пока он заполнял отчет), имя читается из БД и
+    запоминается в небольшом кэше: maxsize ограничивает память, а TTL - время,
+    которое может прожить устаревшее имя.
+    """
+
+    def __init__(
+            self,
+            directory: DirectoryCache,
+            loader: Callable[..., Awaitable[str]],
+            maxsize: int = 1024,
+            ttl: float = 60 * 60,
+    ):
+        self._directory = directory
+        self._loader = loader
+        self._misses: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, user_id: int, session: Optional[AsyncSession] = None) -> str:
+        employee = self._directory.get_employee(user_id)
+        if employee is not None:
+            return employee.fullname
+
+        name = self._misses.get(int(user_id))
+
+        if name is None:
+            name = await self._loader(user_id=user_id, session=session)
+            self._misses[int(user_id)] = name
+
+        return name
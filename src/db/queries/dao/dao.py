@@ -1,13 +1,181 @@
-from sqlalchemy import select, update, and_, func, delete
-from sqlalchemy import Numeric
-from sqlalchemy.orm import joinedload
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import select, update, and_, func, delete, union_all, literal, null, bindparam
+from sqlalchemy import Numeric, String
+from sqlalchemy.dialects.postgresql import insert, TIMESTAMP
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.config import settings
 from src.database import async_engine, async_session, Base
-from src.db.queries.models.models import Employees, Places, Reports, Finances
+from src.db.queries.models.models import Employees, Places, Reports, Finances, ReportDailyRollups, ReportOutbox, JobRuns
 
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone, date
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Запросы, которые выполняются при каждом отчете сотрудника, собираются один раз
+# при импорте: SQLAlchemy берет их скомпилированную форму из кэша по тому же объекту,
+# а asyncpg переиспользует подготовленное выражение на соединении
+_current_name_query = (
+    select(
+        Employees.fullname
+    )
+    .select_from(Employees)
+    .filter(Employees.user_id == bindparam("user_id"))
+)
+
+_inserted_report = (
+    insert(Reports).
+    values(
+        {
+            "revenue": bindparam("revenue"),
+            "place_id": select(Places.id).filter(Places.title == bindparam("place")).scalar_subquery(),
+            "user_id": select(Employees.id).filter(Employees.user_id == bindparam("user_id")).scalar_subquery(),
+            "visitors": bindparam("visitors"),
+        }
+    )
+    .returning(Reports.place_id, Reports.user_id, Reports.report_date, Reports.visitors, Reports.revenue)
+    .cte("inserted_report")
+)
+
+# Отчет и его вклад в дневной агрегат пишутся одним выражением (INSERT ... RETURNING
+# в CTE), поэтому report_daily_rollups всегда совпадает с reports
+_insert_report_stmt = insert(ReportDailyRollups).from_select(
+    ["place_id", "user_id", "day", "visitors", "revenue", "reports_count"],
+    select(
+        _inserted_report.c.place_id,
+        _inserted_report.c.user_id,
+        _inserted_report.c.report_date,
+        _inserted_report.c.visitors,
+        func.cast(_inserted_report.c.revenue, Numeric),
+        literal(1),
+    ),
+)
+_insert_report_stmt = _insert_report_stmt.on_conflict_do_update(
+    index_elements=[ReportDailyRollups.place_id, ReportDailyRollups.user_id, ReportDailyRollups.day],
+    set_={
+        "visitors": ReportDailyRollups.visitors + _insert_report_stmt.excluded.visitors,
+        "revenue": ReportDailyRollups.revenue + _insert_report_stmt.excluded.revenue,
+        "reports_count": ReportDailyRollups.reports_count + _insert_report_stmt.excluded.reports_count,
+    },
+)
+
+
+# Сверка выручки идет по точкам: сначала один запрос находит все точки,
+# у которых подошел срок, затем каждая точка сдвигается отдельным запросом
+# в своей транзакции, которая коммитится только после отправки отчета:
+#   sums    - выручка точки за последние DAYS_FOR_FINANCES_CHECK дней
+#   due     - строка Finances точки, если прошло DAYS_FOR_FINANCES_CHECK дней с прошлой сверки
+#   rotated - updated_money уходит в last_money, на его место пишется новая сумма,
+#             updated_at получает сегодняшнюю дату
+#   seeded  - точки, которых еще нет в Finances, заводятся с last_money = updated_money
+#             (так же, как раньше при первом заполнении пустой таблицы)
+# Повторная проверка updated_at в UPDATE не дает двум процессам отчитаться
+# по одной точке дважды: второй дождется блокировки строки и пропустит ее
+_finance_sums = (
+    select(
+        Reports.place_id,
+        func.sum(Reports.revenue).label("revenue"),
+    )
+    .select_from(Reports)
+    .filter(
+        and_(Reports.report_date.between(bindparam("date_from"), bindparam("date_to")), Reports.place_id.is_not(None))
+    )
+    .group_by(Reports.place_id)
+    .cte("sums")
+)
+
+_place_finance_sums = (
+    select(
+        func.sum(Reports.revenue).label("revenue"),
+    )
+    .select_from(Reports)
+    .filter(
+        and_(
+            Reports.report_date.between(bindparam("date_from"), bindparam("date_to")),
+            Reports.place_id == bindparam("place_id"),
+        )
+    )
+    .scalar_subquery()
+)
+
+_due_finances = (
+    select(
+        Finances.id,
+        Finances.updated_at.label("previous_updated_at"),
+        func.coalesce(_place_finance_sums, 0.0).label("revenue"),
+    )
+    .filter(and_(Finances.place_id == bindparam("place_id"), Finances.updated_at <= bindparam("due_before")))
+    .cte("due")
+)
+
+_rotated_finances = (
+    update(Finances)
+    .filter(
+        and_(Finances.id == _due_finances.c.id, Finances.updated_at <= bindparam("due_before"))
+    )
+    .values(
+        last_money=Finances.updated_money,
+        updated_money=_due_finances.c.revenue,
+        updated_at=bindparam("date_to"),
+    )
+    .returning(
+        Finances.place_id,
+        Finances.last_money,
+        Finances.updated_money,
+        _due_finances.c.previous_updated_at,
+    )
+    .cte("rotated")
+)
+
+_seeded_finances = (
+    insert(Finances)
+    .from_select(
+        ["place_id", "last_money", "updated_money"],
+        select(
+            _finance_sums.c.place_id,
+            _finance_sums.c.revenue,
+            _finance_sums.c.revenue,
+        )
+        .filter(~select(Finances.id).filter(Finances.place_id == _finance_sums.c.place_id).exists()),
+    )
+    .on_conflict_do_nothing(index_elements=[Finances.place_id])
+    .cte("seeded")
+)
+
+_due_places_query = (
+    select(
+        Places.id,
+        Places.title,
+    )
+    .select_from(Finances)
+    .join(Places, Places.id == Finances.place_id)
+    .filter(Finances.updated_at <= bindparam("due_before"))
+    .order_by(Places.title)
+    .add_cte(_seeded_finances)
+)
+
+_rotate_finances_query = (
+    select(
+        Places.title,
+        Places.chat_id,
+        _rotated_finances.c.last_money,
+        _rotated_finances.c.updated_money,
+        _rotated_finances.c.previous_updated_at,
+    )
+    .select_from(_rotated_finances)
+    .join(Places, Places.id == _rotated_finances.c.place_id)
+)
+
+@asynccontextmanager
+async def _session_scope(session: Optional[AsyncSession] = None) -> AsyncIterator[AsyncSession]:
+    # Внутри апдейта сессию открывает и коммитит DbSessionMiddleware (одна транзакция
+    # на действие пользователя), а вне его метод сам открывает и коммитит свою сессию
+    if session is not None:
+        yield session
+        return
+
+    async with async_session() as own_session:
+        yield own_session
+        await own_session.commit()
 
 
 class AsyncOrm:
@@ -18,25 +186,42 @@ class AsyncOrm:
             await conn.run_sync(Base.metadata.create_all)
 
     @staticmethod
-    async def get_current_name(user_id: int):
-        async with async_session() as session:
-            query = (
+    async def get_directory(session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
+            # один запрос на весь справочник: точки и сотрудники (с админами),
+            # чтобы при старте бота было одно подключение вместо шести
+            query = union_all(
                 select(
-                    Employees.fullname
+                    literal("place").label("kind"),
+                    Places.title.label("name"),
+                    Places.chat_id.label("ident"),
+                    null().label("username"),
                 )
-                .select_from(Employees)
-                .filter_by(user_id=user_id)
+                .select_from(Places),
+                select(
+                    Employees.role,
+                    Employees.fullname,
+                    Employees.user_id,
+                    Employees.username,
+                )
+                .select_from(Employees),
             )
-
             res = await session.execute(query)
+
+            # returns List[kind ('place' | 'employee' | 'admin'), title/fullname, chat_id/user_id, username]
+            return res.all()
+
+    @staticmethod
+    async def get_current_name(user_id: int, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
+            res = await session.execute(_current_name_query, {"user_id": user_id})
             result = res.scalars().one()  # тут будет записано имя
 
-            await session.commit()
             return result
 
     @staticmethod
-    async def add_employee(fullname: str, user_id: int, username: str):
-        async with async_session() as session:
+    async def add_employee(fullname: str, user_id: int, username: str, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             stmt = (
                 insert(Employees)
                 .values(fullname=fullname, user_id=user_id, username=username, role="employee")
@@ -46,11 +231,10 @@ class AsyncOrm:
                 set_=dict(fullname=fullname, username=username, role="employee")
             )
             await session.execute(stmt)
-            await session.commit()
 
     @staticmethod
-    async def add_admin(fullname: str, user_id: int, username: str):
-        async with async_session() as session:
+    async def add_admin(fullname: str, user_id: int, username: str, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             stmt = (
                 insert(Employees)
                 .values(fullname=fullname, user_id=user_id, username=username, role="admin")
@@ -60,11 +244,10 @@ class AsyncOrm:
                 set_=dict(fullname=fullname, username=username, role="admin")
             )
             await session.execute(stmt)
-            await session.commit()
 
     @staticmethod
-    async def add_place(title: str, chat_id: int):
-        async with async_session() as session:
+    async def add_place(title: str, chat_id: int, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             stmt = (
                 insert(Places)
                 .values(title=title, chat_id=chat_id)
@@ -74,11 +257,10 @@ class AsyncOrm:
                 set_=dict(title=title)
             )
             await session.execute(stmt)
-            await session.commit()
 
     @staticmethod
-    async def get_employees():
-        async with async_session() as session:
+    async def get_employees(session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             query = (
                 select(
                     Employees.fullname,
@@ -90,12 +272,11 @@ class AsyncOrm:
             res = await session.execute(query)
             result = [(data[0], data[1]) for data in res.all()]
 
-            await session.commit()
             return result
 
     @staticmethod
-    async def get_employee_by_id(user_id: int):
-        async with async_session() as session:
+    async def get_employee_by_id(user_id: int, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             query = (
                 select(
                     Employees.fullname,
@@ -110,12 +291,11 @@ class AsyncOrm:
             res = await session.execute(query)
             result = [data for data in res.one()]
 
-            await session.commit()
             return result
 
     @staticmethod
-    async def get_admins():
-        async with async_session() as session:
+    async def get_admins(session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             query = (
                 select(
                     Employees.fullname,
@@ -127,12 +307,11 @@ class AsyncOrm:
             res = await session.execute(query)
             result = [(data[0], data[1]) for data in res.all()]
 
-            await session.commit()
             return result
 
     @staticmethod
-    async def get_admin_by_id(user_id: int):
-        async with async_session() as session:
+    async def get_admin_by_id(user_id: int, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             query = (
                 select(
                     Employees.fullname,
@@ -147,12 +326,11 @@ class AsyncOrm:
             res = await session.execute(query)
             result = [data for data in res.one()]
 
-            await session.commit()
             return result
 
     @staticmethod
-    async def delete_employee(fullname: str, username: str):
-        async with async_session() as session:
+    async def delete_employee(fullname: str, username: str, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             employee_query = (
                 delete(Employees)
                 .filter_by(
@@ -162,11 +340,10 @@ class AsyncOrm:
                 )
             )
             await session.execute(employee_query)
-            await session.commit()
 
     @staticmethod
-    async def delete_admin(fullname: str, username: str):
-        async with async_session() as session:
+    async def delete_admin(fullname: str, username: str, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             admin_query = (
                 delete(Employees)
                 .filter_by(
@@ -176,339 +353,328 @@ class AsyncOrm:
                 )
             )
             await session.execute(admin_query)
-            await session.commit()
 
     @staticmethod
-    async def delete_place(title: str):
-        async with async_session() as session:
+    async def delete_place(title: str, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             place_query = (
                 delete(Places)
                 .filter_by(title=title)
             )
             await session.execute(place_query)
-            await session.commit()
 
     @staticmethod
-    async def set_data_to_reports(user_id: int, place: str, visitors: int, revenue: float):
-        async with async_session() as session:
-            employee_query = (
-                select(Employees.id).
-                filter_by(user_id=user_id)
-            )
-
-            place_query = (
-                select(Places.id).
-                filter_by(title=place.strip())
-            )
-
-            stmt = (
-                insert(Reports).
-                values(
-                    {
-                        "revenue": revenue,
-                        "place_id": place_query,
-                        "user_id": employee_query,
-                        "visitors": visitors,
-                    }
-                )
+    async def set_data_to_reports(user_id: int, place: str, visitors: int, revenue: float, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
+            await session.execute(
+                _insert_report_stmt,
+                {
+                    "revenue": revenue,
+                    "place": place.strip(),
+                    "user_id": user_id,
+                    "visitors": visitors,
+                },
             )
 
-            await session.execute(stmt)
-            await session.commit()
-
     @staticmethod
-    async def get_visitors_data_from_reports_by_date(date_from: date, date_to: date):
-        async with async_session() as session:
+    async def get_visitors_data_from_reports_by_date(date_from: date, date_to: date, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
+            # читаем дневные агрегаты, а не сырые отчеты: стоимость не зависит
+            # от количества отчетов, только от дней и точек в периоде
             query = (
                 select(
                     Places.title,
                     Employees.fullname,
-                    Reports.user_id,
-                    func.sum(Reports.visitors),
+                    ReportDailyRollups.user_id,
+                    func.sum(ReportDailyRollups.visitors),
                 )
-                .select_from(Reports)
-                .join(Reports.place)
-                .join(Reports.employee)
+                .select_from(ReportDailyRollups)
+                .join(Places, ReportDailyRollups.place_id == Places.id)
+                .join(Employees, ReportDailyRollups.user_id == Employees.id)
                 .filter(
-                    Reports.report_date.between(date_from, date_to)
+                    ReportDailyRollups.day.between(date_from, date_to)
                 )
                 .group_by(
                     Places.title,
                     Employees.fullname,
-                    Reports.user_id,
+                    ReportDailyRollups.user_id,
                 )
                 .order_by(Places.title)
             )
             res = await session.execute(query)
-            await session.commit()
 
             # returns List[places.title, employees.fullname, reports.user_id, sum of visitors]
             return res.all()
 
     @staticmethod
-    async def get_revenue_data_from_reports_by_date(date_from: date, date_to: date):
-        async with async_session() as session:
+    async def get_revenue_data_from_reports_by_date(date_from: date, date_to: date, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             query = (
                 select(
                     func.coalesce(Places.title, 'удаленная точка'),
                     func.coalesce(Employees.fullname, 'удаленный сотр.'),
-                    Reports.user_id,
-                    func.concat(func.sum(func.cast(Reports.revenue, Numeric))),
+                    ReportDailyRollups.user_id,
+                    func.concat(func.sum(ReportDailyRollups.revenue)),
                 )
-                .select_from(Reports)
-                .join(Reports.place, isouter=True)
-                .join(Reports.employee, isouter=True)
+                .select_from(ReportDailyRollups)
+                .join(Places, ReportDailyRollups.place_id == Places.id, isouter=True)
+                .join(Employees, ReportDailyRollups.user_id == Employees.id, isouter=True)
                 .filter(
-                    Reports.report_date.between(date_from, date_to),
+                    ReportDailyRollups.day.between(date_from, date_to),
                 )
                 .group_by(
                     Places.title,
                     Employees.fullname,
-                    Reports.user_id,
+                    ReportDailyRollups.user_id,
                 )
-                .order_by(Reports.user_id)
+                .order_by(ReportDailyRollups.user_id)
             )
             res = await session.execute(query)
-            await session.commit()
 
             # returns List[places.title, employees.fullname, reports.user_id, sum of revenue]
             return res.all()
 
     @staticmethod
-    async def set_data_to_finances_default():
-        async with async_session() as session:
+    async def get_due_finance_places(session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             time_now = datetime.now(tz=timezone(timedelta(hours=3.0))).date()
             time_N_days_ago = time_now - timedelta(days=settings.DAYS_FOR_FINANCES_CHECK) + timedelta(days=1)
 
-            sum_of_revenue_query = (
-                select(
-                    Reports.place_id,
-                    func.sum(Reports.revenue)
-                )
-                .select_from(Reports)
-                .filter(
-                    Reports.report_date.between(time_N_days_ago, time_now)
-                )
-                .group_by(Reports.place_id)
-            )
-
-            res = await session.execute(sum_of_revenue_query)
-            data_from_reports = {int(place_id): float(summary) for place_id, summary in res.all()}
-
-            # На этом этапе я получил новые выручки
-            # за прошлые N дней
-            await session.flush()
-
-            # Если не пришло никакого результата из Reports,
-            # то Reports пустая, а это значит, что ничего делать не будем
-            # и выйдем из функции
-            if not data_from_reports:
-                return
-
-            # Если таблица Finances была пустая, то я вставлю в
-            # last_money и updated_money одинаковые значения,
-            # так как еще не было суммы новее, поэтому они должны быть равны
-            stmt = (
-                insert(Finances)
-                .values(
-                    [
-                        {"place_id": place_id, "last_money": updated_money, "updated_money": updated_money}
-                        for place_id, updated_money in data_from_reports.items()
-                    ]
-                )
+            # заодно заводит в Finances новые точки (seeded)
+            res = await session.execute(
+                _due_places_query,
+                {
+                    "date_from": time_N_days_ago,
+                    "date_to": time_now,
+                    "due_before": time_now - timedelta(days=settings.DAYS_FOR_FINANCES_CHECK),
+                },
             )
 
-            await session.execute(stmt)
-            await session.commit()
-
-            # Выхожу из метода, так как нет смысла делать что-либо дальше
-            # Я обновил всё, что можно на данный момент
-            await session.commit()
-            return
+            # returns List[places.id, places.title]
+            return res.all()
 
     @staticmethod
-    async def set_data_to_finances_by_place(place_id: int):
-        async with async_session() as session:
+    async def rotate_due_finances(place_id: int, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             time_now = datetime.now(tz=timezone(timedelta(hours=3.0))).date()
             time_N_days_ago = time_now - timedelta(days=settings.DAYS_FOR_FINANCES_CHECK) + timedelta(days=1)
 
-            sum_of_revenue_query = (
-                select(
-                    Reports.place_id,
-                    func.sum(Reports.revenue)
-                )
-                .select_from(Reports)
-                .filter(
-                    and_(Reports.report_date.between(time_N_days_ago, time_now), Reports.place_id == place_id)
-                )
-                .group_by(Reports.place_id)
-            )
-
-            res = await session.execute(sum_of_revenue_query)
-            data_from_reports = {int(place_id): float(summary) for place_id, summary in res.all()}
-
-            # если такой точки еще не было в Finances,
-            # то ее нужно там создать, а далее выйти из функции
-            if not await AsyncOrm._check_finances_for_null_by_place(place_id=place_id):
-                stmt = (
-                    insert(Finances)
-                    .values(
-                        [
-                            {"place_id": place_id, "updated_money": updated_money, "last_money": 0}
-                            for place_id, updated_money in data_from_reports.items()
-                        ]
-                    )
-                )
-                await session.execute(stmt)
-                await session.commit()
-                return
-
-            last_updated_money_query = (
-                select(
-                    Finances.updated_money
-                )
-                .select_from(Finances)
-                .filter_by(place_id=place_id)
+            res = await session.execute(
+                _rotate_finances_query,
+                {
+                    "place_id": place_id,
+                    "date_from": time_N_days_ago,
+                    "date_to": time_now,
+                    "due_before": time_now - timedelta(days=settings.DAYS_FOR_FINANCES_CHECK),
+                },
             )
-            res = await session.execute(last_updated_money_query)
-            data_from_finances_for_place = {
-                "place_id": place_id, "last_money": float(res.scalar()),
-            }
 
-            # На данном этапе я получил старое
-            # значение updated_money для конкретной точки, чтобы
-            # вставить их в last_money для этой же точки
-            await session.flush()
+            # returns (places.title, places.chat_id, last_money, updated_money, previous updated_at)
+            # или None, если точку уже сверил другой процесс
+            return res.one_or_none()
 
+    @staticmethod
+    async def add_report_to_outbox(
+            idempotency_key: str,
+            kind: str,
+            chat_id: int,
+            user_id: int,
+            steps: List[Dict[str, Any]],
+            session: Optional[AsyncSession] = None,
+    ):
+        async with _session_scope(session) as session:
             stmt = (
-                insert(Finances)
-                .values(data_from_finances_for_place)
-                .on_conflict_do_update(
-                    index_elements=[Finances.place_id],
-                    set_={
-                        "last_money": insert(Finances).excluded.last_money,
-                    }
+                insert(ReportOutbox)
+                .values(
+                    idempotency_key=idempotency_key,
+                    kind=kind,
+                    chat_id=chat_id,
+                    user_id=user_id,
+                    steps=steps,
                 )
+                .on_conflict_do_nothing(index_elements=[ReportOutbox.idempotency_key])
             )
             await session.execute(stmt)
 
-            # На этом этапе last_money содержит
-            # старое значение updated_money
-            #
-            # Теперь мне нужно в updated_money
-            # вставить новое значение, которые пришло
-            # из таблицы Reports (новые выручки точки за прошлые N дней)
-            await session.flush()
-
+    @staticmethod
+    async def claim_outbox_reports(
+            limit: int,
+            lease_seconds: float,
+            claim_token: str,
+            session: Optional[AsyncSession] = None,
+    ):
+        async with _session_scope(session) as session:
+            # забираем отчеты, у которых подошло время попытки, и сдвигаем им
+            # next_attempt_at на время аренды: если процесс упадет во время отправки,
+            # отчет снова станет доступен, а другие процессы его пока не возьмут.
+            # claimed_by отличает эту аренду от следующих, если она все-таки истечет
+            due = (
+                select(ReportOutbox.id)
+                .filter(and_(ReportOutbox.status == "pending", ReportOutbox.next_attempt_at <= func.now()))
+                .order_by(ReportOutbox.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
             stmt = (
-                insert(Finances)
+                update(ReportOutbox)
+                .filter(ReportOutbox.id.in_(due))
                 .values(
-                    [
-                        {"place_id": place_id, "updated_money": updated_money}
-                        for place_id, updated_money in data_from_reports.items()
-                    ]
+                    next_attempt_at=func.now() + timedelta(seconds=lease_seconds),
+                    claimed_by=claim_token,
                 )
-                .on_conflict_do_update(
-                    index_elements=[Finances.place_id],
-                    set_={
-                        "updated_money": insert(Finances).excluded.updated_money,
-                    },
+                .returning(
+                    ReportOutbox.id,
+                    ReportOutbox.chat_id,
+                    ReportOutbox.user_id,
+                    ReportOutbox.steps,
+                    ReportOutbox.progress,
+                    ReportOutbox.attempts,
                 )
             )
+            res = await session.execute(stmt)
 
-            # Я обновил updated_money новым значением,
-            # и теперь можно спокойно выходить из функции
-            await session.execute(stmt)
-            await session.commit()
+            # returns List[id, chat_id, user_id, steps, progress, attempts]
+            return sorted(res.all(), key=lambda row: row.id)
 
     @staticmethod
-    async def get_data_from_finances_by_place(place_id: int):
-        async with async_session() as session:
-            time_now = datetime.now(tz=timezone(timedelta(hours=3.0))).date()
+    async def set_outbox_progress(
+            outbox_id: int,
+            claim_token: str,
+            expected_progress: int,
+            progress: int,
+            is_sent: bool,
+            lease_seconds: float,
+            session: Optional[AsyncSession] = None,
+    ) -> bool:
+        async with _session_scope(session) as session:
+            lease_until = func.now() + timedelta(seconds=lease_seconds)
+
+            values = {"progress": progress, "next_attempt_at": lease_until}
+            if is_sent:
+                values.update(status="sent", sent_at=func.now(), claimed_by=None)
+
+            # прогресс пишет только тот, кто держит аренду, и только поверх того,
+            # что он сам видел; иначе отчет уже забрал другой доставщик
+            res = await session.execute(
+                update(ReportOutbox)
+                .filter(and_(
+                    ReportOutbox.id == outbox_id,
+                    ReportOutbox.claimed_by == claim_token,
+                    ReportOutbox.progress == expected_progress,
+                ))
+                .values(values)
+                .returning(ReportOutbox.id)
+            )
+            updated = res.scalar_one_or_none() is not None
 
-            query = (
-                select(
-                    Finances,
-                )
-                .select_from(Finances)
-                .filter_by(place_id=place_id)
-                .options(joinedload(Finances.place))
+            # остальные отчеты этой аренды ждут своей очереди в чате - продлеваем и их
+            await session.execute(
+                update(ReportOutbox)
+                .filter(and_(ReportOutbox.claimed_by == claim_token, ReportOutbox.status == "pending"))
+                .values(next_attempt_at=lease_until)
             )
 
-            res = await session.execute(query)
-            result = [
-                (
-                    data.place.title,
-                    data.place.chat_id,
-                    data.last_money,
-                    data.updated_money,
-                    data.updated_at,
-                ) for data in res.scalars().all()
-            ]
-
-            # обновлю дату updated_at в Finances, так как я получил
-            # и вывел всю старую нужную информацию в этой функции
+            return updated
 
-            stmt = (
-                update(Finances).values(updated_at=time_now).filter_by(place_id=place_id)
+    @staticmethod
+    async def set_outbox_failure(
+            outbox_id: int,
+            claim_token: str,
+            attempts: int,
+            error: str,
+            retry_in_seconds: Optional[float],
+            session: Optional[AsyncSession] = None,
+    ) -> bool:
+        async with _session_scope(session) as session:
+            # retry_in_seconds=None - попытки закончились, отчет больше не доставляется
+            values = {"attempts": attempts, "last_error": error, "claimed_by": None}
+            if retry_in_seconds is None:
+                values["status"] = "failed"
+            else:
+                values["next_attempt_at"] = func.now() + timedelta(seconds=retry_in_seconds)
+
+            res = await session.execute(
+                update(ReportOutbox)
+                .filter(and_(ReportOutbox.id == outbox_id, ReportOutbox.claimed_by == claim_token))
+                .values(values)
+                .returning(ReportOutbox.id)
             )
-            await session.execute(stmt)
-            await session.commit()
 
-            return result
+            return res.scalar_one_or_none() is not None
 
     @staticmethod
-    async def _check_data_from_finances():
-        async with async_session() as session:
-            # если таблица Finances пустая, то заполняю ее дефолтными значениями
-            if not await AsyncOrm._check_finances_for_null():
-                await AsyncOrm.set_data_to_finances_default()
-
-            query = (
-                select(
-                    Places.id,
-                    Finances.updated_at,
-                )
-                .select_from(Finances)
-                .join(Places, Finances.place_id == Places.id)
+    async def start_job_run(job_name: str, scheduled_at: datetime, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
+            res = await session.execute(
+                insert(JobRuns).values(job_name=job_name, scheduled_at=scheduled_at).returning(JobRuns.id)
             )
-            res = await session.execute(query)
-            result = res.all()
 
-            await session.commit()
-            return result
+            return res.scalar_one()
 
     @staticmethod
-    async def _check_finances_for_null_by_place(place_id: int):
-        async with async_session() as session:
-            query = (
-                select(Finances)
-                .select_from(Finances)
-                .filter_by(place_id=place_id)
+    async def finish_job_run(run_id: int, error: Optional[str] = None, session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
+            stmt = (
+                update(JobRuns)
+                .filter_by(id=run_id)
+                .values(
+                    status="ok" if error is None else "failed",
+                    error=error,
+                    finished_at=func.now(),
+                    duration_ms=func.extract("epoch", func.now() - JobRuns.started_at) * 1000,
+                )
             )
-            res = await session.execute(query)
-            await session.commit()
+            await session.execute(stmt)
 
-            return res.scalars().all()
+    @staticmethod
+    async def add_place_job_run(
+            parent_id: int,
+            place: str,
+            started_at: datetime,
+            duration_ms: int,
+            error: Optional[str] = None,
+            session: Optional[AsyncSession] = None,
+    ):
+        async with _session_scope(session) as session:
+            parent = select(JobRuns.job_name, JobRuns.scheduled_at).filter_by(id=parent_id).subquery()
+            stmt = insert(JobRuns).from_select(
+                ["job_name", "scheduled_at", "parent_id", "place_id", "status", "error",
+                 "started_at", "finished_at", "duration_ms"],
+                select(
+                    parent.c.job_name,
+                    parent.c.scheduled_at,
+                    literal(parent_id),
+                    select(Places.id).filter_by(title=place).scalar_subquery(),
+                    literal("ok" if error is None else "failed"),
+                    literal(error, String),
+                    literal(started_at, TIMESTAMP(timezone=True)),
+                    func.now(),
+                    literal(duration_ms),
+                ),
+            )
+            await session.execute(stmt)
 
     @staticmethod
-    async def _check_finances_for_null():
-        async with async_session() as session:
+    async def get_last_job_runs(session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
+            # прерванные и упавшие запуски не считаются - после перезапуска они повторятся
             query = (
-                select("*")
-                .select_from(Finances)
+                select(JobRuns.job_name, func.max(JobRuns.scheduled_at))
+                .filter(and_(JobRuns.parent_id.is_(None), JobRuns.status == "ok"))
+                .group_by(JobRuns.job_name)
             )
             res = await session.execute(query)
 
-            return res.all()
+            # returns Dict[job_name, scheduled_at of the last successful run]
+            return dict(res.all())
 
     @staticmethod
-    async def _check_reports_for_null():
-        async with async_session() as session:
+    async def _check_reports_for_null(session: Optional[AsyncSession] = None):
+        async with _session_scope(session) as session:
             query = (
                 select(Reports)
             )
             res = await session.execute(query)
-            await session.commit()
 
             return res.scalars().all()
\ No newline at end of file
@@ -1,10 +1,10 @@
-from sqlalchemy.dialects.postgresql import BIGINT, INTEGER, DATE
+from sqlalchemy.dialects.postgresql import BIGINT, INTEGER, DATE, NUMERIC, JSONB, TIMESTAMP
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import text, ForeignKey
+from sqlalchemy import text, ForeignKey, Index
 
 from src.database import Base
 
-from typing import Annotated
+from typing import Annotated, Optional
 from datetime import datetime, timezone, timedelta
 
 created_at = Annotated[datetime, mapped_column(
@@ -20,6 +20,9 @@ updated_at = Annotated[datetime, mapped_column(
 
 class Employees(Base):
     __tablename__ = "employees"
+    __table_args__ = (
+        Index("ix_employees_role", "role"),
+    )
 
     id = mapped_column(INTEGER, primary_key=True)
     fullname: Mapped[str]
@@ -47,6 +50,9 @@ class Finances(Base):
 
 class Places(Base):
     __tablename__ = "places"
+    __table_args__ = (
+        Index("ix_places_title", "title", unique=True),
+    )
 
     id = mapped_column(INTEGER, primary_key=True)
     title: Mapped[str]
@@ -61,6 +67,10 @@ class Places(Base):
 
 class Reports(Base):
     __tablename__ = "reports"
+    __table_args__ = (
+        Index("ix_reports_place_id_report_date", "place_id", "report_date"),
+        Index("ix_reports_user_id_report_date", "user_id", "report_date"),
+    )
 
     id = mapped_column(INTEGER, primary_key=True)
     report_date: Mapped[created_at]
@@ -74,3 +84,75 @@ class Reports(Base):
     # one-2-many bound (one employee -> many reports)
     user_id: Mapped[int] = mapped_column(ForeignKey("employees.id", ondelete="SET NULL"))
     employee: Mapped["Employees"] = relationship(back_populates="reports", uselist=False)
+
+
+class ReportDailyRollups(Base):
+    __tablename__ = "report_daily_rollups"
+    __table_args__ = (
+        # по этому индексу set_data_to_reports делает upsert; после удаления точки
+        # или сотрудника строки с NULL не конфликтуют и просто суммируются в статистике
+        Index("uq_report_daily_rollups_place_user_day", "place_id", "user_id", "day", unique=True),
+        Index("ix_report_daily_rollups_day", "day"),
+    )
+
+    id = mapped_column(INTEGER, primary_key=True)
+    day = mapped_column(DATE, nullable=False)
+    visitors: Mapped[int] = mapped_column(default=0)
+    revenue = mapped_column(NUMERIC, nullable=False, default=0)
+    reports_count: Mapped[int] = mapped_column(default=0)
+
+    place_id: Mapped[int] = mapped_column(ForeignKey("places.id", ondelete="SET NULL"), nullable=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("employees.id", ondelete="SET NULL"), nullable=True)
+
+
+class ReportOutbox(Base):
+    __tablename__ = "report_outbox"
+    __table_args__ = (
+        # доставщик выбирает только недоставленные отчеты, у которых подошло время попытки
+        Index("ix_report_outbox_pending", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+    )
+
+    id = mapped_column(INTEGER, primary_key=True)
+    # повторное нажатие кнопки "отправить" не создаст второй отчет
+    idempotency_key: Mapped[str] = mapped_column(unique=True)
+    kind: Mapped[str]
+    chat_id = mapped_column(BIGINT, nullable=False)
+    user_id = mapped_column(BIGINT, nullable=False)
+
+    # готовые к отправке шаги (сообщения и альбомы) и сколько из них уже доставлено
+    steps = mapped_column(JSONB, nullable=False)
+    progress: Mapped[int] = mapped_column(default=0, server_default=text("0"))
+
+    # pending -> sent | failed
+    status: Mapped[str] = mapped_column(default="pending", server_default=text("'pending'"))
+    attempts: Mapped[int] = mapped_column(default=0, server_default=text("0"))
+    last_error: Mapped[Optional[str]]
+    # токен текущей аренды: прогресс может записать только доставщик, который ее держит
+    claimed_by: Mapped[Optional[str]]
+    next_attempt_at = mapped_column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
+    created_at = mapped_column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
+    sent_at = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+
+
+class JobRuns(Base):
+    __tablename__ = "job_runs"
+    __table_args__ = (
+        # последний запуск каждой задачи при старте планировщика
+        Index("ix_job_runs_job_name_scheduled_at", "job_name", "scheduled_at"),
+    )
+
+    id = mapped_column(INTEGER, primary_key=True)
+    job_name: Mapped[str]
+    # время запуска по расписанию (без jitter) - по нему ищутся пропущенные запуски
+    scheduled_at = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+
+    # строка без parent_id - запуск задачи целиком, с parent_id - обработка одной точки в этом запуске
+    parent_id: Mapped[Optional[int]] = mapped_column(ForeignKey("job_runs.id", ondelete="CASCADE"))
+    place_id: Mapped[Optional[int]] = mapped_column(ForeignKey("places.id", ondelete="SET NULL"))
+
+    # running -> ok | failed
+    status: Mapped[str] = mapped_column(default="running", server_default=text("'running'"))
+    error: Mapped[Optional[str]]
+    started_at = mapped_column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
+    finished_at = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    duration_ms: Mapped[Optional[int]]
@@ -1,9 +1,8 @@
 from aiogram.filters import BaseFilter
 from aiogram.types import Message
-from src.db import cached_admins, cached_employees
+from src.db import directory
 
 
 class CheckUserFilter(BaseFilter):
     async def __call__(self, message: Message) -> bool:
-        user_id = int(message.from_user.id)
-        return not (user_id in cached_employees or user_id in cached_admins)
\ No newline at end of file
+        return not directory.is_known_user(message.from_user.id)
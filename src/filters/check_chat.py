@@ -1,8 +1,8 @@
 from aiogram.filters import BaseFilter
 from aiogram.types import Message
-from src.db import cached_chat_ids
+from src.db import directory
 
 
 class CheckChatFilter(BaseFilter):
     async def __call__(self, message: Message) -> bool:
-        return not int(message.chat.id) not in cached_chat_ids
\ No newline at end of file
+        return directory.is_place_chat(message.chat.id)
\ No newline at end of file
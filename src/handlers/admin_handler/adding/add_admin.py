@@ -2,13 +2,14 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.keyboards.adm_keyboard import create_admin_kb, check_add_admin
 from src.keyboards.keyboard import create_cancel_kb
 from src.fsm.fsm import FSMAdmin
 from src.handlers.admin_handler.adding.add_employee import router_admin
 from src.db.queries.dao.dao import AsyncOrm
-from src.db import cached_admins, cached_admins_fullname_and_id
+from src.db import directory
 
 router_add_adm = Router()
 router_admin.include_router(router_add_adm)
@@ -109,18 +110,23 @@ async def warning_add_admin_username_command(message: Message):
 
 
 @router_add_adm.callback_query(StateFilter(FSMAdmin.check_admin), F.data == "access_admin")
-async def process_access_admin_command(callback: CallbackQuery, state: FSMContext):
+async def process_access_admin_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
 
     await AsyncOrm.add_admin(
         fullname=data["admin_name"],
         user_id=data["admin_id"],
         username=data["admin_username"],
+        session=session,
     )
-    if data["admin_id"] not in cached_admins:
-        cached_admins.append(data["admin_id"])
-    if (data["admin_name"], data["admin_id"]) not in cached_admins_fullname_and_id:
-        cached_admins_fullname_and_id.append((data["admin_name"], data["admin_id"]))
+    directory.upsert_employee(
+        user_id=data["admin_id"],
+        fullname=data["admin_name"],
+        username=data["admin_username"],
+        role="admin",
+    )
+    # транзакцию закрываем до ответа в Telegram (см. DbSessionMiddleware)
+    await session.commit()
 
     await callback.message.answer(
         text=f"Администратор <b>{data['admin_name']}</b> с id=<b>{data['admin_id']}</b> "
@@ -2,13 +2,15 @@ from aiogram.types import CallbackQuery, Message, ReplyKeyboardRemove
 from aiogram import F, Router
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.keyboards.adm_keyboard import create_admin_kb, check_add_place
 from src.keyboards.keyboard import create_cancel_kb
 from src.fsm.fsm import FSMAdmin
 from src.handlers.admin_handler.adding.add_employee import router_admin
 from src.db.queries.dao.dao import AsyncOrm
-from src.db import cached_places, cached_chat_ids
+from src.db import directory
 
 router_add_place = Router()
 router_admin.include_router(router_add_place)
@@ -86,16 +88,31 @@ async def warning_collect_place_id_chat_command(message: Message):
 
 
 @router_admin.callback_query(StateFilter(FSMAdmin.check_place), F.data == "access_place")
-async def process_accept_place_command(callback: CallbackQuery, state: FSMContext):
+async def process_accept_place_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
 
-    await AsyncOrm.add_place(
+    try:
+        await AsyncOrm.add_place(
+            title=data["title"],
+            chat_id=data["chat_id"],
+            session=session,
+        )
+    except IntegrityError:
+        # названия точек уникальны (ix_places_title)
+        await session.rollback()
+        await callback.message.answer(
+            text=f'Рабочая точка с названием "{data["title"]}" уже есть, измените название',
+            reply_markup=check_add_place(),
+        )
+        await callback.answer()
+        return
+
+    directory.upsert_place(
         title=data["title"],
         chat_id=data["chat_id"],
     )
-    cached_places[data["title"]] = data["chat_id"]
-    if data["chat_id"] not in cached_chat_ids:
-        cached_chat_ids.append(data["chat_id"])
+    # транзакцию закрываем до ответа в Telegram (см. DbSessionMiddleware)
+    await session.commit()
 
     await callback.message.answer(
         text=f'Рабочая точка "{data["title"]}" с chat_id={data["chat_id"]} <b>успешно</b> добавлена!',
@@ -2,13 +2,14 @@ from aiogram.types import CallbackQuery
 from aiogram import Router, F
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.keyboards.adm_keyboard import create_employee_list_kb, create_admin_kb, create_delete_kb
 from src.callbacks.employee import EmployeeCallbackFactory
 from src.fsm.fsm import FSMAdmin
 from src.handlers.admin_handler.adding.add_employee import router_admin
 from src.db.queries.dao.dao import AsyncOrm
-from src.db import cached_employees, cached_employees_fullname_and_id
+from src.db import directory
 
 router_del_emp = Router()
 router_admin.include_routers(router_del_emp)
@@ -25,8 +26,10 @@ async def process_del_emp_command(callback: CallbackQuery, state: FSMContext):
 
 
 @router_del_emp.callback_query(StateFilter(FSMAdmin.which_employee_to_delete), EmployeeCallbackFactory.filter())
-async def process_which_emp_to_del_command(callback: CallbackQuery, callback_data: EmployeeCallbackFactory, state: FSMContext):
-    fullname, username = await AsyncOrm.get_employee_by_id(user_id=callback_data.user_id)
+async def process_which_emp_to_del_command(callback: CallbackQuery, callback_data: EmployeeCallbackFactory, state: FSMContext, session: AsyncSession):
+    fullname, username = await AsyncOrm.get_employee_by_id(user_id=callback_data.user_id, session=session)
+    # транзакцию закрываем до ответа в Telegram (см. DbSessionMiddleware)
+    await session.commit()
 
     await state.update_data(fullname=fullname)
     await state.update_data(username=username)
@@ -52,15 +55,17 @@ async def process_go_back_which_do_delete_command(callback: CallbackQuery, state
 
 
 @router_del_emp.callback_query(StateFilter(FSMAdmin.deleting_employee), F.data == "delete")
-async def process_deleting_employee_command(callback: CallbackQuery, state: FSMContext):
+async def process_deleting_employee_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
 
     await AsyncOrm.delete_employee(
         fullname=data["fullname"],
         username=data["username"],
+        session=session,
     )
-    cached_employees.remove(data["user_id"])
-    cached_employees_fullname_and_id.remove((data["fullname"], data["user_id"]))
+    directory.remove_employee(user_id=data["user_id"])
+    # транзакцию закрываем до ответа в Telegram (см. DbSessionMiddleware)
+    await session.commit()
 
     await callback.message.edit_text(
         text=f"Сотрудник {data['fullname']} успешно удален!\n\n"
@@ -2,13 +2,14 @@ from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.keyboards.adm_keyboard import create_places_list_kb, create_admin_kb, create_delete_kb
 from src.callbacks.place import PlaceCallbackFactory
 from src.fsm.fsm import FSMAdmin
 from src.handlers.admin_handler.adding.add_employee import router_admin
 from src.db.queries.dao.dao import AsyncOrm
-from src.db import cached_places, cached_chat_ids
+from src.db import directory
 
 router_del_place = Router()
 router_admin.include_router(router_del_place)
@@ -50,14 +51,16 @@ async def process_go_back_which_do_place_delete_command(callback: CallbackQuery,
 
 
 @router_del_place.callback_query(StateFilter(FSMAdmin.deleting_place), F.data == "delete")
-async def process_deleting_place_command(callback: CallbackQuery, state: FSMContext):
+async def process_deleting_place_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
 
     await AsyncOrm.delete_place(
         title=data["title"],
+        session=session,
     )
-    cached_places.pop(data["title"])
-    cached_chat_ids.remove(data["chat_id"])
+    directory.remove_place(title=data["title"])
+    # транзакцию закрываем до ответа в Telegram (см. DbSessionMiddleware)
+    await session.commit()
 
     await callback.message.edit_text(
         text=f'Рабочая точка "{data["title"]}" <b>успешно</b> удалена!\n\n'
@@ -5,6 +5,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardButton
 from aiogram import Router, F
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.db.queries.dao.dao import AsyncOrm
 from src.keyboards.adm_keyboard import create_stats_kb, create_stats_money_kb
@@ -17,13 +18,17 @@ router_admin.include_router(router_adm_money)
 
 async def get_report_revenue_by_date(
         date_from: date,
-        date_to: date
+        date_to: date,
+        session: AsyncSession,
 ):
     places = dict()
     data = await AsyncOrm.get_revenue_data_from_reports_by_date(
         date_from=date_from,
         date_to=date_to,
+        session=session,
     )
+    # транзакцию закрываем до ответа в Telegram (см. DbSessionMiddleware)
+    await session.commit()
 
     for place_title, fullname, _, total_revenue in data:
         places.setdefault(place_title, []).append((fullname, total_revenue))
@@ -69,7 +74,7 @@ async def process_adm_stats_money_back_command(callback: CallbackQuery, state: F
 
 
 @router_adm_money.callback_query(StateFilter(FSMStatisticsMoney.in_stats), F.data == "adm_money_by_week")
-async def process_adm_money_by_week_command(callback: CallbackQuery):
+async def process_adm_money_by_week_command(callback: CallbackQuery, session: AsyncSession):
     date_now = datetime.now(tz=timezone(timedelta(hours=3.0))).date()
     date_last_week = date_now - timedelta(days=7)
 
@@ -91,6 +96,7 @@ async def process_adm_money_by_week_command(callback: CallbackQuery):
         text=await get_report_revenue_by_date(
             date_from=date_last_week,
             date_to=date_now,
+            session=session,
         ),
         reply_markup=builder.as_markup(),
         parse_mode="html",
@@ -99,7 +105,7 @@ async def process_adm_money_by_week_command(callback: CallbackQuery):
 
 
 @router_adm_money.callback_query(StateFilter(FSMStatisticsMoney.in_stats), F.data == "adm_money_by_month")
-async def process_adm_money_by_month_command(callback: CallbackQuery):
+async def process_adm_money_by_month_command(callback: CallbackQuery, session: AsyncSession):
     date_now = datetime.now(tz=timezone(timedelta(hours=3.0))).date()
     date_last_week = date_now - timedelta(days=30)
 
@@ -121,6 +127,7 @@ async def process_adm_money_by_month_command(callback: CallbackQuery):
         text=await get_report_revenue_by_date(
             date_from=date_last_week,
             date_to=date_now,
+            session=session,
         ),
         reply_markup=builder.as_markup(),
         parse_mode="html",
@@ -129,7 +136,7 @@ async def process_adm_money_by_month_command(callback: CallbackQuery):
 
 
 @router_adm_money.callback_query(StateFilter(FSMStatisticsMoney.in_stats), F.data == "adm_money_by_year")
-async def process_adm_money_by_year_command(callback: CallbackQuery):
+async def process_adm_money_by_year_command(callback: CallbackQuery, session: AsyncSession):
     date_now = datetime.now(tz=timezone(timedelta(hours=3.0))).date()
     date_last_week = date_now - timedelta(days=365)
 
@@ -151,6 +158,7 @@ async def process_adm_money_by_year_command(callback: CallbackQuery):
         text=await get_report_revenue_by_date(
             date_from=date_last_week,
             date_to=date_now,
+            session=session,
         ),
         reply_markup=builder.as_markup(),
         parse_mode="html",
@@ -181,7 +189,7 @@ async def process_adm_money_by_custom_command(callback: CallbackQuery, state: FS
 
 
 @router_adm_money.message(StateFilter(FSMStatisticsMoney.custom_date), F.text)
-async def process_adm_money_custom_date_command(message: Message, state: FSMContext):
+async def process_adm_money_custom_date_command(message: Message, state: FSMContext, session: AsyncSession):
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="➢ Назад", callback_data="adm_stats_money_back_from_custom"))
 
@@ -213,6 +221,7 @@ async def process_adm_money_custom_date_command(message: Message, state: FSMCont
                 text=await get_report_revenue_by_date(
                     date_from=date_from,
                     date_to=date_to,
+                    session=session,
                 ),
                 reply_markup=create_stats_money_kb(),
                 parse_mode="html",
@@ -227,6 +236,7 @@ async def process_adm_money_custom_date_command(message: Message, state: FSMCont
                     text=await get_report_revenue_by_date(
                         date_from=date_from,
                         date_to=date_to,
+                        session=session,
                     ),
                     reply_markup=create_stats_money_kb(),
                     parse_mode="html",
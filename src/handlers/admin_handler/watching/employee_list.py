@@ -2,6 +2,7 @@ from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.keyboards.adm_keyboard import create_employee_list_kb, create_admin_kb, create_watching_employees_kb
 from src.callbacks.employee import EmployeeCallbackFactory
@@ -34,8 +35,10 @@ async def process_go_back_command(callback: CallbackQuery, state: FSMContext):
 
 
 @router_show_emp.callback_query(StateFilter(FSMAdmin.watching_employees), EmployeeCallbackFactory.filter())
-async def process_watching_info_command(callback: CallbackQuery, callback_data: EmployeeCallbackFactory, state: FSMContext):
-    fullname, username = await AsyncOrm.get_employee_by_id(user_id=callback_data.user_id)
+async def process_watching_info_command(callback: CallbackQuery, callback_data: EmployeeCallbackFactory, state: FSMContext, session: AsyncSession):
+    fullname, username = await AsyncOrm.get_employee_by_id(user_id=callback_data.user_id, session=session)
+    # транзакцию закрываем до ответа в Telegram (см. DbSessionMiddleware)
+    await session.commit()
 
     await state.update_data(fullname=fullname)
     await state.update_data(username=username)
@@ -2,33 +2,37 @@ from typing import Dict, Any, Union
 from datetime import datetime, timedelta, timezone
 
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InputMediaPhoto, ReplyKeyboardRemove
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.state import default_state
 from aiogram.fsm.context import FSMContext
-from aiogram.exceptions import TelegramAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.keyboards.keyboard import create_cancel_kb, create_yes_no_kb, create_places_kb
+from src.keyboards.keyboard import create_cancel_kb, create_yes_no_kb, create_places_kb, create_resend_report_kb
 from src.fsm.fsm import FSMDailyChecking
-from src.middleware.album_middleware import AlbumsMiddleware
+from src.middleware.album_middleware import albums
 from src.lexicon.lexicon_ru import RUSSIAN_WEEK_DAYS
 from src.callbacks.place import PlaceCallbackFactory
-from src.db.queries.dao.dao import AsyncOrm
+from src.outbox import enqueue_report, outbox_deliverer
 from src.config import settings
-from src.db import cached_places
+from src.db import directory, names
 import logging
 
 logger = logging.getLogger(__name__)
 
 router_daily = Router()
-router_daily.message.middleware(middleware=AlbumsMiddleware(2))
 
+# альбомы в этом флоу собираются общим middleware диспетчера
+albums.register_flow(FSMDailyChecking)
+albums.register(FSMDailyChecking.working_place_photo, field="working_place_photo")
+albums.register(FSMDailyChecking.defects_photo, field="defects_photo")
 
-async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int]) -> str:
+
+async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int], session: AsyncSession) -> str:
     return f"📔Дневная сверка:\n\n" \
            f"Дата: {date}\n" \
            f"Точка: {dictionary['place']}\n" \
-           f"Имя: {await AsyncOrm.get_current_name(user_id=user_id)}\n\n" \
+           f"Имя: {await names.get(user_id=user_id, session=session)}\n\n" \
            f"Количество оплат равно количеству посетителей: <em>{'да' if dictionary['check_people_pays'] == 'yes' else 'нет'}</em>\n" \
            f"Есть ли дефекты у коньков: <em>{'нет' if dictionary['is_ice_rank_defects'] == 'no' else 'да⚠️'}</em>\n" \
            f"Количество проданных билетов: <em>{dictionary['count_tickets']}</em>\n" \
@@ -37,78 +41,60 @@ async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int]
            f"Есть ли жалобы или предложения от посетителей: <em>{'нет' if dictionary['book_of_suggestions'] == 'no' else dictionary['book_info']}</em>"
 
 
-async def send_report(message: Message, state: FSMContext, data: dict, date: str, chat_id: Union[str, int]):
+async def send_report(message: Message, state: FSMContext, data: dict, date: str, chat_id: Union[str, int], session: AsyncSession):
     try:
-        await message.bot.send_message(
+        # все фото отчета уходят минимальным числом альбомов
+        categories = [("Фото проката", data["working_place_photo"])]
+
+        if data["is_ice_rank_defects"] == "yes":
+            categories.append(("Фото дефектов у коньков", data["defects_photo"]))
+
+        await enqueue_report(
+            kind="daily_checking",
+            message=message,
             chat_id=chat_id,
             text=await report(
                 dictionary=data,
                 date=date,
                 user_id=message.chat.id,
+                session=session,
             ),
-            reply_markup=ReplyKeyboardRemove(),
-            parse_mode="html",
-        )
-
-        working_place = [
-            InputMediaPhoto(
-                media=photo_file_id,
-                caption="Фото проката" if i == 0 else ""
-            ) for i, photo_file_id in enumerate(data["working_place_photo"])
-        ]
-
-        await message.bot.send_media_group(
-            chat_id=chat_id,
-            media=working_place
+            categories=categories,
+            session=session,
         )
 
-        if data["is_ice_rank_defects"] == "yes":
-            ice_rank_defects = [
-                InputMediaPhoto(
-                    media=photo_file_id,
-                    caption="Фото дефектов у коньков" if i == 0 else ""
-                ) for i, photo_file_id in enumerate(data["defects_photo"])
-            ]
-
-            await message.bot.send_media_group(
-                chat_id=chat_id,
-                media=ice_rank_defects
-            )
+        # отчет сохранен - в чат точки его доставит outbox_deliverer,
+        # сотрудник не ждет отправки всех фото
+        await session.commit()
+        outbox_deliverer.wake()
 
-        await message.answer(
-            text="Отлично! Отчёт успешно отправлен👍🏻",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        await message.answer(
-            text="Вы вернулись в главное меню"
-        )
+        # ответы сотрудника удаляем только после того, как отчет сохранен
+        await state.clear()
 
     except Exception as e:
-        logger.exception("Ошибка не с телеграм в daily_checking.py при отправке отчета")
-        await message.bot.send_message(
-            text=f"Daily checking report error: {e}\n"
-                 f"User id: {message.chat.id}",
-            chat_id=settings.ADMIN_ID,
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        await message.answer(
-            text="Упс... что-то пошло не так, сообщите руководству!",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-    except TelegramAPIError as e:
-        logger.exception("Ошибка с телеграм в daily_checking.py при отправке отчета")
+        await session.rollback()
+        logger.exception("Ошибка в daily_checking.py при сохранении отчета")
         await message.bot.send_message(
             text=f"Daily checking report error: {e}\n"
                  f"User id: {message.chat.id}",
             chat_id=settings.ADMIN_ID,
             reply_markup=ReplyKeyboardRemove(),
         )
+        # ответы и фото остаются в FSM, отчет можно отправить повторно
         await message.answer(
-            text="Упс... что-то пошло не так, сообщите руководству!",
-            reply_markup=ReplyKeyboardRemove(),
+            text="Упс... не удалось сохранить отчёт😔\n"
+                 "Ваши ответы не потерялись - попробуйте отправить отчёт ещё раз",
+            reply_markup=create_resend_report_kb(),
         )
-    finally:
-        await state.clear()
+        return
+
+    await message.answer(
+        text="Отлично! Отчёт принят и будет отправлен👍🏻",
+        reply_markup=ReplyKeyboardRemove(),
+    )
+    await message.answer(
+        text="Вы вернулись в главное меню",
+    )
 
 
 @router_daily.message(Command(commands="daily_checking"), StateFilter(default_state))
@@ -360,7 +346,7 @@ async def warning_count_tickets_command(message: Message):
 
 
 @router_daily.message(StateFilter(FSMDailyChecking.summary), F.text.isdigit())
-async def process_summary_command(message: Message, state: FSMContext):
+async def process_summary_command(message: Message, state: FSMContext, session: AsyncSession):
     await state.update_data(summary=message.text)
 
     day_of_week = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime('%A')
@@ -374,7 +360,8 @@ async def process_summary_command(message: Message, state: FSMContext):
         state=state,
         data=daily_check_dict,
         date=current_date,
-        chat_id=cached_places[daily_check_dict["place"]],
+        chat_id=directory.get_chat_id(daily_check_dict["place"]),
+        session=session,
     )
 
 
@@ -386,3 +373,24 @@ async def warning_summary_command(message: Message):
         reply_markup=create_cancel_kb(),
         parse_mode="html",
     )
+
+
+@router_daily.callback_query(StateFilter(FSMDailyChecking.summary), F.data == "resend_report")
+async def process_resend_report_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    # отчет не сохранился, но ответы остались в FSM - пробуем сохранить еще раз
+    await callback.message.delete_reply_markup()
+
+    day_of_week = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime('%A')
+    current_date = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime(f'%d/%m/%Y - {RUSSIAN_WEEK_DAYS[day_of_week]}')
+
+    daily_check_dict = await state.get_data()
+
+    await send_report(
+        message=callback.message,
+        state=state,
+        data=daily_check_dict,
+        date=current_date,
+        chat_id=directory.get_chat_id(daily_check_dict["place"]),
+        session=session,
+    )
+    await callback.answer()
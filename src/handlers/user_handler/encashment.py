@@ -1,98 +1,103 @@
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Union, Any
 
-from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove, InputMediaPhoto
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove
 from aiogram import Router, F
 from aiogram.fsm.state import default_state
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command, StateFilter
-from aiogram.exceptions import TelegramAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.fsm.fsm import FSMEncashment
-from src.keyboards.keyboard import create_cancel_kb, create_yes_no_kb, create_places_kb
-from src.middleware.album_middleware import AlbumsMiddleware
+from src.keyboards.keyboard import create_cancel_kb, create_yes_no_kb, create_places_kb, create_resend_report_kb
+from src.middleware.album_middleware import albums
 from src.lexicon.lexicon_ru import RUSSIAN_WEEK_DAYS
 from src.config import settings
 from src.callbacks.place import PlaceCallbackFactory
-from src.db import cached_places
-from src.db.queries.dao.dao import AsyncOrm
+from src.outbox import enqueue_report, outbox_deliverer
+from src.db import directory, names
 import logging
 
 logger = logging.getLogger(__name__)
 
 router_encashment = Router()
-router_encashment.message.middleware(middleware=AlbumsMiddleware(2))
 
+# альбомы в этом флоу собираются общим middleware диспетчера
+albums.register_flow(FSMEncashment)
+albums.register(FSMEncashment.receipts_photo, field="receipts_photo")
+
+
+async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int], session: AsyncSession) -> str:
+    if dictionary.get("is_encashment") == "no":
+        return "📝 Инкассация:\n\n" \
+               f"Дата: {date}\n" \
+               f"Точка: {dictionary['place']}\n" \
+               f"Имя: {await names.get(user_id=user_id, session=session)}\n\n" \
+               "⚠️Инкассации нет!"
 
-async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int]) -> str:
     return f"📝 Инкассация:\n\n" \
            f"Дата: {date}\n" \
            f"Точка: {dictionary['place']}\n" \
-           f"Имя: {await AsyncOrm.get_current_name(user_id=user_id)}\n\n" \
+           f"Имя: {await names.get(user_id=user_id, session=session)}\n\n" \
            f"Сумма инкассации: <em>{dictionary['cash']}</em>\n" \
            f"Дата инкассации: <em>{dictionary['date']}</em>"
 
 
-async def send_report(message: Message, state: FSMContext, data: dict, date: str, chat_id: Union[str, int]):
+async def send_report(message: Message, state: FSMContext, data: dict, date: str, chat_id: Union[str, int], session: AsyncSession):
     try:
-        await message.bot.send_message(
+        # все фото отчета уходят минимальным числом альбомов
+        categories = []
+
+        # если инкассации не было, отчет состоит из одного сообщения
+        if "receipts_photo" in data:
+            categories.append(("Фото необходимых чеков", data["receipts_photo"]))
+
+        await enqueue_report(
+            kind="encashment",
+            message=message,
             chat_id=chat_id,
             text=await report(
                 dictionary=data,
                 date=date,
                 user_id=message.chat.id,
+                session=session,
             ),
-            reply_markup=ReplyKeyboardRemove(),
-            parse_mode="html",
+            categories=categories,
+            session=session,
         )
 
-        receipts = [
-            InputMediaPhoto(
-                media=photo_file_id,
-                caption="Фото необходимых чеков" if i == 0 else ""
-            ) for i, photo_file_id in enumerate(data["receipts_photo"])
-        ]
-
-        await message.bot.send_media_group(
-            chat_id=chat_id,
-            media=receipts,
-        )
+        # отчет сохранен - в чат точки его доставит outbox_deliverer,
+        # сотрудник не ждет отправки всех фото
+        await session.commit()
+        outbox_deliverer.wake()
 
-        await message.answer(
-            text="Отлично! Отчёт успешно отправлен👍🏻",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-
-        await message.answer(
-            text="Вы вернулись в главное меню"
-        )
+        # ответы сотрудника удаляем только после того, как отчет сохранен
+        await state.clear()
 
     except Exception as e:
-        logger.exception("Ошибка не с телеграм в encashment.py при отправке отчета")
-        await message.bot.send_message(
-            text=f"Encashment report error: {e}\n"
-                 f"User id: {message.chat.id}",
-            chat_id=settings.ADMIN_ID,
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        await message.answer(
-            text="Упс... что-то пошло не так, сообщите руководству!",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-    except TelegramAPIError as e:
-        logger.exception("Ошибка с телеграм в encashment.py при отправке отчета")
+        await session.rollback()
+        logger.exception("Ошибка в encashment.py при сохранении отчета")
         await message.bot.send_message(
             text=f"Encashment report error: {e}\n"
                  f"User id: {message.chat.id}",
             chat_id=settings.ADMIN_ID,
             reply_markup=ReplyKeyboardRemove(),
         )
+        # ответы и фото остаются в FSM, отчет можно отправить повторно
         await message.answer(
-            text="Упс... что-то пошло не так, сообщите руководству!",
-            reply_markup=ReplyKeyboardRemove(),
+            text="Упс... не удалось сохранить отчёт😔\n"
+                 "Ваши ответы не потерялись - попробуйте отправить отчёт ещё раз",
+            reply_markup=create_resend_report_kb(),
         )
-    finally:
-        await state.clear()
+        return
+
+    await message.answer(
+        text="Отлично! Отчёт принят и будет отправлен👍🏻",
+        reply_markup=ReplyKeyboardRemove(),
+    )
+    await message.answer(
+        text="Вы вернулись в главное меню",
+    )
 
 
 @router_encashment.message(Command(commands="encashment"), StateFilter(default_state))
@@ -138,51 +143,31 @@ async def process_is_encashment_yes_command(callback: CallbackQuery, state: FSMC
 
 
 @router_encashment.callback_query(StateFilter(FSMEncashment.is_encashment), F.data == "no")
-async def process_is_encashment_no_command(callback: CallbackQuery, state: FSMContext):
+async def process_is_encashment_no_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    await state.update_data(is_encashment="no")
     await callback.message.delete_reply_markup()
     await callback.message.edit_text(
         text="У вас есть инкассация за вчерашний день?\n\n"
              "➢ Нет"
     )
+    await callback.message.answer(
+        text="Спасибо большое за информацию!"
+    )
 
     day_of_week = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime('%A')
     current_date = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime(f'%d/%m/%Y - {RUSSIAN_WEEK_DAYS[day_of_week]}')
 
     encashment_dict = await state.get_data()
 
-    try:
-        await callback.message.bot.send_message(
-            text="📝 Инкассация:\n\n"
-                 f"Дата: {current_date}\n"
-                 f"Точка: {encashment_dict['place']}\n"
-                 f"Имя: {await AsyncOrm.get_current_name(user_id=callback.message.chat.id)}\n\n"
-                 "⚠️Инкассации нет!",
-            chat_id=cached_places[encashment_dict["place"]],
-        )
-        await callback.message.answer(
-            text="Спасибо большое за информацию!"
-        )
-        await callback.message.answer(
-            text="Отлично! Отчёт успешно отправлен👍🏻",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        await callback.message.answer(
-            text="Вы вернулись в главное меню"
-        )
-    except TelegramBadRequest as e:
-        await callback.message.bot.send_message(
-            text=f"Encashment report error: {e}\n"
-                 f"User id: {callback.message.chat.id}",
-            chat_id=settings.ADMIN_ID,
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        await callback.message.answer(
-            text="Упс... что-то пошло не так, сообщите руководству!",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-    finally:
-        await callback.answer()
-        await state.clear()
+    await send_report(
+        message=callback.message,
+        state=state,
+        data=encashment_dict,
+        date=current_date,
+        chat_id=directory.get_chat_id(encashment_dict["place"]),
+        session=session,
+    )
+    await callback.answer()
 
 
 @router_encashment.message(StateFilter(FSMEncashment.receipts_photo))
@@ -222,7 +207,7 @@ async def warning_cash_command(message: Message):
 
 
 @router_encashment.message(StateFilter(FSMEncashment.date), F.text)
-async def process_date_command(message: Message, state: FSMContext):
+async def process_date_command(message: Message, state: FSMContext, session: AsyncSession):
     await state.update_data(date=message.text)
 
     day_of_week = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime('%A')
@@ -235,7 +220,8 @@ async def process_date_command(message: Message, state: FSMContext):
         state=state,
         data=encashment_dict,
         date=current_date,
-        chat_id=cached_places[encashment_dict["place"]],
+        chat_id=directory.get_chat_id(encashment_dict["place"]),
+        session=session,
     )
 
 
@@ -245,3 +231,24 @@ async def warning_date_command(message: Message):
         text="Напишите дату, за которую инкассировали!",
         reply_markup=create_cancel_kb(),
     )
+
+
+@router_encashment.callback_query(StateFilter(FSMEncashment.date, FSMEncashment.is_encashment), F.data == "resend_report")
+async def process_resend_report_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    # отчет не сохранился, но ответы остались в FSM - пробуем сохранить еще раз
+    await callback.message.delete_reply_markup()
+
+    day_of_week = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime('%A')
+    current_date = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime(f'%d/%m/%Y - {RUSSIAN_WEEK_DAYS[day_of_week]}')
+
+    encashment_dict = await state.get_data()
+
+    await send_report(
+        message=callback.message,
+        state=state,
+        data=encashment_dict,
+        date=current_date,
+        chat_id=directory.get_chat_id(encashment_dict["place"]),
+        session=session,
+    )
+    await callback.answer()
@@ -1,34 +1,41 @@
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Union, Any
 
-from aiogram.types import Message, CallbackQuery, InputMediaPhoto, ReplyKeyboardRemove
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove
 from aiogram.filters import StateFilter, Command
 from aiogram.fsm.state import default_state
 from aiogram.fsm.context import FSMContext
 from aiogram import F, Router
-from aiogram.exceptions import TelegramAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.keyboards.keyboard import create_places_kb, create_cancel_kb, create_yes_no_kb, create_salaries_checking_kb
-from src.middleware.album_middleware import AlbumsMiddleware
+from src.keyboards.keyboard import create_places_kb, create_cancel_kb, create_yes_no_kb, create_salaries_checking_kb, create_resend_report_kb
+from src.middleware.album_middleware import albums
 from src.lexicon.lexicon_ru import RUSSIAN_WEEK_DAYS
 from src.config import settings
 from src.fsm.fsm import FSMFinishShift
 from src.callbacks.place import PlaceCallbackFactory
-from src.db import cached_places
+from src.outbox import enqueue_report, outbox_deliverer
+from src.db import directory, names
 from src.db.queries.dao.dao import AsyncOrm
 import logging
 
 logger = logging.getLogger(__name__)
 
 router_finish = Router()
-router_finish.message.middleware(middleware=AlbumsMiddleware(2))
 
+# альбомы в этом флоу собираются общим middleware диспетчера
+albums.register_flow(FSMFinishShift)
+albums.register(FSMFinishShift.receipts_photo, field="receipts_photo")
+albums.register(FSMFinishShift.benefits_photo, field="benefits_photo")
+albums.register(FSMFinishShift.defects_photo, field="defects_photo")
+albums.register(FSMFinishShift.depend_defects_photo, field="depend_defects_photo")
 
-async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int]) -> str:
+
+async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int], session: AsyncSession) -> str:
     return f"📝Закрытие смены:\n\n" \
            f"Дата: {date}\n" \
            f"Точка: {dictionary['place']}\n" \
-           f"Имя: {await AsyncOrm.get_current_name(user_id=user_id)}\n\n" \
+           f"Имя: {await names.get(user_id=user_id, session=session)}\n\n" \
            f"Произведена дезинфекция: <em>{'да' if dictionary['is_disinfection'] == 'yes' else 'нет⚠️'}</em>\n" \
            f"Коньки на сушке: <em>{'да' if dictionary['ice_rank_on_drying'] == 'yes' else 'нет⚠️'}</em>\n" \
            f"Есть ли дефекты у коньков: <em>{'да⚠️' if dictionary['is_ice_rank_defects'] == 'yes' else 'нет'}</em>\n" \
@@ -46,120 +53,83 @@ async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int]
            f"Зарплаты сотрудников:\n<em>{dictionary['salaries']}</em>"
 
 
-async def send_report(message: Message, state: FSMContext, data: dict, date: str, chat_id: Union[str, int]):
+async def send_report(message: Message, state: FSMContext, data: dict, date: str, chat_id: Union[str, int], session: AsyncSession):
     try:
-        await message.bot.send_message(
-            chat_id=chat_id,
-            text=await report(
-                dictionary=data,
-                date=date,
-                user_id=message.chat.id,
-            ),
-            reply_markup=ReplyKeyboardRemove(),
-            parse_mode="html",
-        )
+        # все фото отчета уходят минимальным числом альбомов
+        categories, notes = [], []
 
         if "receipts_photo" in data:
-            receipts = [
-                InputMediaPhoto(
-                    media=photo_file_id,
-                    caption="Необходимые чеки" if i == 0 else ""
-                ) for i, photo_file_id in enumerate(data["receipts_photo"])
-            ]
-
-            await message.bot.send_media_group(
-                chat_id=chat_id,
-                media=receipts,
-            )
+            categories.append(("Необходимые чеки", data["receipts_photo"]))
 
         if data["is_benefits"] == "yes":
             if "benefits_photo" in data:
                 if data["benefits_photo"] != "no":
-                    benefits = [
-                        InputMediaPhoto(
-                            media=photo_file_id,
-                            caption="Льготники" if i == 0 else ""
-                        ) for i, photo_file_id in enumerate(data["benefits_photo"])
-                    ]
-
-                    await message.bot.send_media_group(
-                        chat_id=chat_id,
-                        media=benefits,
-                    )
+                    categories.append(("Льготники", data["benefits_photo"]))
                 else:
-                    await message.bot.send_message(
-                        text="⚠️Льготники были, но нет фотографий удостоверений⚠️",
-                        chat_id=chat_id,
-                        reply_markup=ReplyKeyboardRemove(),
-                    )
+                    notes.append("⚠️Льготники были, но нет фотографий удостоверений⚠️")
 
         if data["is_ice_rank_defects"] == "yes":
-            ice_rank_defects = [
-                InputMediaPhoto(
-                    media=photo_file_id,
-                    caption="Дефекты у коньков" if i == 0 else ""
-                ) for i, photo_file_id in enumerate(data["defects_photo"])
-            ]
-
-            await message.bot.send_media_group(
-                chat_id=chat_id,
-                media=ice_rank_defects,
-            )
+            categories.append(("Дефекты у коньков", data["defects_photo"]))
 
         if data["is_depend_defects"] == "yes":
-            depend_defects = [
-                InputMediaPhoto(
-                    media=photo_file_id,
-                    caption="Дефекты защиты и шлемов" if i == 0 else ""
-                ) for i, photo_file_id in enumerate(data["depend_defects_photo"])
-            ]
-
-            await message.bot.send_media_group(
-                chat_id=chat_id,
-                media=depend_defects,
-            )
+            categories.append(("Дефекты защиты и шлемов", data["depend_defects_photo"]))
 
+        # выручка и посетители попадают в reports в той же транзакции, что и отчет в outbox
         await AsyncOrm.set_data_to_reports(
             user_id=message.chat.id,
             place=data["place"],
             visitors=data["visitors"],
             revenue=data["summary"],
+            session=session,
         )
 
-        await message.answer(
-            text="Отлично! Отчёт успешно отправлен👍🏻",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        await message.answer(
-            text="Вы вернулись в главное меню"
+        await enqueue_report(
+            kind="finish_shift",
+            message=message,
+            chat_id=chat_id,
+            text=await report(
+                dictionary=data,
+                date=date,
+                user_id=message.chat.id,
+                session=session,
+            ),
+            categories=categories,
+            notes=notes,
+            session=session,
         )
 
+        # отчет сохранен - в чат точки его доставит outbox_deliverer,
+        # сотрудник не ждет отправки всех фото
+        await session.commit()
+        outbox_deliverer.wake()
+
+        # ответы сотрудника удаляем только после того, как отчет сохранен
+        await state.clear()
+
     except Exception as e:
-        logger.exception("Ошибка не с телеграм в finish_shift.py при отправке отчета")
-        await message.bot.send_message(
-            text=f"Finish shift report error: {e}\n"
-                 f"User id: {message.chat.id}",
-            chat_id=settings.ADMIN_ID,
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        await message.answer(
-            text="Упс... что-то пошло не так, сообщите руководству!",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-    except TelegramAPIError as e:
-        logger.exception("Ошибка с телеграм в finish_shift.py при отправке отчета")
+        await session.rollback()
+        logger.exception("Ошибка в finish_shift.py при сохранении отчета")
         await message.bot.send_message(
             text=f"Finish shift report error: {e}\n"
                  f"User id: {message.chat.id}",
             chat_id=settings.ADMIN_ID,
             reply_markup=ReplyKeyboardRemove(),
         )
+        # ответы и фото остаются в FSM, отчет можно отправить повторно
         await message.answer(
-            text="Упс... что-то пошло не так, сообщите руководству!",
-            reply_markup=ReplyKeyboardRemove(),
+            text="Упс... не удалось сохранить отчёт😔\n"
+                 "Ваши ответы не потерялись - попробуйте отправить отчёт ещё раз",
+            reply_markup=create_resend_report_kb(),
         )
-    finally:
-        await state.clear()
+        return
+
+    await message.answer(
+        text="Отлично! Отчёт принят и будет отправлен👍🏻",
+        reply_markup=ReplyKeyboardRemove(),
+    )
+    await message.answer(
+        text="Вы вернулись в главное меню",
+    )
 
 
 @router_finish.message(Command(commands="finish_shift"), StateFilter(default_state))
@@ -703,7 +673,7 @@ async def process_is_clear_zone_of_ice_no_command(callback: CallbackQuery, state
 
 
 @router_finish.callback_query(StateFilter(FSMFinishShift.is_working_place_closed), F.data == "yes")
-async def process_working_place_command(callback: CallbackQuery, state: FSMContext):
+async def process_working_place_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     await state.update_data(is_working_place_closed="yes")
     await callback.message.delete_reply_markup()
     await callback.message.edit_text(
@@ -721,14 +691,15 @@ async def process_working_place_command(callback: CallbackQuery, state: FSMConte
         state=state,
         data=finish_shift_dict,
         date=current_date,
-        chat_id=cached_places[finish_shift_dict["place"]],
+        chat_id=directory.get_chat_id(finish_shift_dict["place"]),
+        session=session,
     )
 
     await callback.answer()
 
 
 @router_finish.callback_query(StateFilter(FSMFinishShift.is_working_place_closed), F.data == "no")
-async def process_working_place_command(callback: CallbackQuery, state: FSMContext):
+async def process_working_place_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     await state.update_data(is_working_place_closed="no")
     await callback.message.delete_reply_markup()
     await callback.message.edit_text(
@@ -746,7 +717,29 @@ async def process_working_place_command(callback: CallbackQuery, state: FSMConte
         state=state,
         data=finish_shift_dict,
         date=current_date,
-        chat_id=cached_places[finish_shift_dict["place"]],
+        chat_id=directory.get_chat_id(finish_shift_dict["place"]),
+        session=session,
     )
 
     await callback.answer()
+
+
+@router_finish.callback_query(StateFilter(FSMFinishShift.is_working_place_closed), F.data == "resend_report")
+async def process_resend_report_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    # отчет не сохранился, но ответы остались в FSM - пробуем сохранить еще раз
+    await callback.message.delete_reply_markup()
+
+    day_of_week = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime('%A')
+    current_date = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime(f'%d/%m/%Y - {RUSSIAN_WEEK_DAYS[day_of_week]}')
+
+    finish_shift_dict = await state.get_data()
+
+    await send_report(
+        message=callback.message,
+        state=state,
+        data=finish_shift_dict,
+        date=current_date,
+        chat_id=directory.get_chat_id(finish_shift_dict["place"]),
+        session=session,
+    )
+    await callback.answer()
@@ -2,33 +2,41 @@ from typing import Dict, Any, Union
 from datetime import datetime, timezone, timedelta
 
 from aiogram import Router, F
-from aiogram.types import Message, ReplyKeyboardRemove, InputMediaPhoto, CallbackQuery
+from aiogram.types import Message, ReplyKeyboardRemove, CallbackQuery
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.state import default_state
 from aiogram.fsm.context import FSMContext
-from aiogram.exceptions import TelegramAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.fsm.fsm import FSMStartShift
-from src.keyboards.keyboard import create_yes_no_kb, create_cancel_kb, create_places_kb, create_good_or_bad_kb
-from src.middleware.album_middleware import AlbumsMiddleware
+from src.keyboards.keyboard import create_yes_no_kb, create_cancel_kb, create_places_kb, create_good_or_bad_kb, create_resend_report_kb
+from src.middleware.album_middleware import albums
 from src.lexicon.lexicon_ru import RUSSIAN_WEEK_DAYS
 from src.config import settings
 from src.callbacks.place import PlaceCallbackFactory
-from src.db import cached_places
-from src.db.queries.dao.dao import AsyncOrm
+from src.outbox import enqueue_report, outbox_deliverer
+from src.db import directory, names
 import logging
 
 logger = logging.getLogger(__name__)
 
 router_start_shift = Router()
-router_start_shift.message.middleware(middleware=AlbumsMiddleware(2))
 
+# альбомы в этом флоу собираются общим middleware диспетчера
+albums.register_flow(FSMStartShift)
+albums.register(FSMStartShift.employee_photo, field=None)  # нужно одно фото
+albums.register(FSMStartShift.working_place_photo, field="working_place_photo")
+albums.register(FSMStartShift.cloakroom_photo, field="cloakroom_photo")
+albums.register(FSMStartShift.defects_photo, field="defects_photo")
+albums.register(FSMStartShift.penguins_defects_photo, field="penguins_defects_photo")
+albums.register(FSMStartShift.boxes_defects_photo, field="boxes_defects_photo")
 
-async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int]) -> str:
+
+async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int], session: AsyncSession) -> str:
     return "📝Открытие смены:\n\n" \
            f"Дата: {date}\n" \
            f"Точка: {dictionary['place']}\n" \
-           f"Имя: {await AsyncOrm.get_current_name(user_id=user_id)}\n\n" \
+           f"Имя: {await names.get(user_id=user_id, session=session)}\n\n" \
            f"Есть дефекты у коньков: <em>{'нет' if dictionary['is_defects'] == 'no' else 'да⚠️'}</em>\n" \
            f"Все шнурки заправлены: <em>{'да' if dictionary['laces'] == 'yes' else 'no⚠️'}</em>\n" \
            f"Есть одноразовые шапочки и носки: <em>{'да' if dictionary['hats_and_socks'] == 'yes' else 'нет⚠️'}</em>\n" \
@@ -39,126 +47,74 @@ async def report(dictionary: Dict[str, Any], date: str, user_id: Union[str, int]
            f"Состояние льда: <em>{'хорошее🟢' if dictionary['what_state_of_ice'] == 'good' else 'плохое🔴'}</em>"
 
 
-async def send_report(message: Message, state: FSMContext, data: dict, date: str, chat_id: Union[str, int]):
+async def send_report(message: Message, state: FSMContext, data: dict, date: str, chat_id: Union[str, int], session: AsyncSession):
     try:
-        await message.bot.send_message(
-            chat_id=chat_id,
-            text=await report(
-                dictionary=data,
-                date=date,
-                user_id=message.chat.id,
-            ),
-            reply_markup=ReplyKeyboardRemove(),
-            parse_mode="html",
-        )
-
-        await message.bot.send_photo(
-            chat_id=chat_id,
-            photo=data["employee_photo"],
-            caption="Фото сотрудника",
-        )
+        # все фото отчета уходят минимальным числом альбомов
+        categories = [("Фото сотрудника", [data["employee_photo"]])]
 
         # фото павильона (рабочее место)
         if data["working_place_photo"]:
-            working_place_photos = [
-                InputMediaPhoto(
-                    media=photo_file_id,
-                    caption="Фото рабочего места" if i == 0 else ""
-                ) for i, photo_file_id in enumerate(data["working_place_photo"])
-            ]
-
-            await message.bot.send_media_group(
-                chat_id=chat_id,
-                media=working_place_photos
-            )
+            categories.append(("Фото рабочего места", data["working_place_photo"]))
 
         # фото раздевалки
         if data["cloakroom_photo"]:
-            working_place_photos = [
-                InputMediaPhoto(
-                    media=photo_file_id,
-                    caption="Фото раздевалки" if i == 0 else ""
-                ) for i, photo_file_id in enumerate(data["cloakroom_photo"])
-            ]
-
-            await message.bot.send_media_group(
-                chat_id=chat_id,
-                media=working_place_photos
-            )
+            categories.append(("Фото раздевалки", data["cloakroom_photo"]))
 
         if data["is_defects"] == "yes":
-            ice_rank_defects = [
-                InputMediaPhoto(
-                    media=photo_file_id,
-                    caption="Фото дефектов у коньков" if i == 0 else ""
-                ) for i, photo_file_id in enumerate(data["defects_photo"])
-            ]
-
-            await message.bot.send_media_group(
-                chat_id=chat_id,
-                media=ice_rank_defects,
-            )
+            categories.append(("Фото дефектов у коньков", data["defects_photo"]))
 
         if data["is_penguins"] == "yes":
-            penguins_defects = [
-                InputMediaPhoto(
-                    media=photo_file_id,
-                    caption="Фото дефектов у пингвинов" if i == 0 else ""
-                ) for i, photo_file_id in enumerate(data["penguins_defects_photo"])
-            ]
-
-            await message.bot.send_media_group(
-                chat_id=chat_id,
-                media=penguins_defects,
-            )
+            categories.append(("Фото дефектов у пингвинов", data["penguins_defects_photo"]))
 
         if data["is_boxes"] == "yes":
-            boxes_defects = [
-                InputMediaPhoto(
-                    media=photo_file_id,
-                    caption="Фото дефектов ящиков хранения" if i == 0 else ""
-                ) for i, photo_file_id in enumerate(data["boxes_defects_photo"])
-            ]
-
-            await message.bot.send_media_group(
-                chat_id=chat_id,
-                media=boxes_defects,
-            )
+            categories.append(("Фото дефектов ящиков хранения", data["boxes_defects_photo"]))
 
-        await message.answer(
-            text="Отлично! Отчёт успешно отправлен👍🏻",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        await message.answer(
-            text="Вы вернулись в главное меню",
+        await enqueue_report(
+            kind="start_shift",
+            message=message,
+            chat_id=chat_id,
+            text=await report(
+                dictionary=data,
+                date=date,
+                user_id=message.chat.id,
+                session=session,
+            ),
+            categories=categories,
+            session=session,
         )
 
+        # отчет сохранен - в чат точки его доставит outbox_deliverer,
+        # сотрудник не ждет отправки всех фото
+        await session.commit()
+        outbox_deliverer.wake()
+
+        # ответы сотрудника удаляем только после того, как отчет сохранен
+        await state.clear()
+
     except Exception as e:
-        logger.exception("Ошибка не с телеграм в start_shift.py при отправке отчета")
-        await message.bot.send_message(
-            text=f"Start shift report error: {e}\n"
-                 f"User id: {message.chat.id}",
-            chat_id=settings.ADMIN_ID,
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        await message.answer(
-            text="Упс... что-то пошло не так, сообщите руководству!",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-    except TelegramAPIError as e:
-        logger.exception("Ошибка с телеграм в start_shift.py при отправке отчета")
+        await session.rollback()
+        logger.exception("Ошибка в start_shift.py при сохранении отчета")
         await message.bot.send_message(
             text=f"Start shift report error: {e}\n"
                  f"User id: {message.chat.id}",
             chat_id=settings.ADMIN_ID,
             reply_markup=ReplyKeyboardRemove(),
         )
+        # ответы и фото остаются в FSM, отчет можно отправить повторно
         await message.answer(
-            text="Упс... что-то пошло не так, сообщите руководству!",
-            reply_markup=ReplyKeyboardRemove(),
+            text="Упс... не удалось сохранить отчёт😔\n"
+                 "Ваши ответы не потерялись - попробуйте отправить отчёт ещё раз",
+            reply_markup=create_resend_report_kb(),
         )
-    finally:
-        await state.clear()
+        return
+
+    await message.answer(
+        text="Отлично! Отчёт принят и будет отправлен👍🏻",
+        reply_markup=ReplyKeyboardRemove(),
+    )
+    await message.answer(
+        text="Вы вернулись в главное меню",
+    )
 
 
 @router_start_shift.message(Command(commands="start_shift"), StateFilter(default_state))
@@ -591,7 +547,7 @@ async def process_is_alert_no_command(callback: CallbackQuery, state: FSMContext
 
 
 @router_start_shift.callback_query(StateFilter(FSMStartShift.what_state_of_ice), F.data == "good")
-async def process_what_state_of_ice_good_command(callback: CallbackQuery, state: FSMContext):
+async def process_what_state_of_ice_good_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     await state.update_data(what_state_of_ice="good")
     await callback.message.delete_reply_markup()
     await callback.message.edit_text(
@@ -612,13 +568,14 @@ async def process_what_state_of_ice_good_command(callback: CallbackQuery, state:
         state=state,
         data=start_shift_dict,
         date=current_date,
-        chat_id=cached_places[start_shift_dict["place"]],
+        chat_id=directory.get_chat_id(start_shift_dict["place"]),
+        session=session,
     )
     await callback.answer()
 
 
 @router_start_shift.callback_query(StateFilter(FSMStartShift.what_state_of_ice), F.data == "bad")
-async def process_what_state_of_ice_bad_command(callback: CallbackQuery, state: FSMContext):
+async def process_what_state_of_ice_bad_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     await state.update_data(what_state_of_ice="bad")
     await callback.message.delete_reply_markup()
     await callback.message.edit_text(
@@ -640,6 +597,28 @@ async def process_what_state_of_ice_bad_command(callback: CallbackQuery, state:
         state=state,
         data=start_shift_dict,
         date=current_date,
-        chat_id=cached_places[start_shift_dict["place"]],
+        chat_id=directory.get_chat_id(start_shift_dict["place"]),
+        session=session,
+    )
+    await callback.answer()
+
+
+@router_start_shift.callback_query(StateFilter(FSMStartShift.what_state_of_ice), F.data == "resend_report")
+async def process_resend_report_command(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    # отчет не сохранился, но ответы остались в FSM - пробуем сохранить еще раз
+    await callback.message.delete_reply_markup()
+
+    day_of_week = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime('%A')
+    current_date = datetime.now(tz=timezone(timedelta(hours=3.0))).strftime(f'%d/%m/%Y - {RUSSIAN_WEEK_DAYS[day_of_week]}')
+
+    start_shift_dict = await state.get_data()
+
+    await send_report(
+        message=callback.message,
+        state=state,
+        data=start_shift_dict,
+        date=current_date,
+        chat_id=directory.get_chat_id(start_shift_dict["place"]),
+        session=session,
     )
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
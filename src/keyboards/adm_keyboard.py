@@ -2,7 +2,7 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from src.callbacks.employee import EmployeeCallbackFactory
 from src.callbacks.admin import AdminCallbackFactory
 from src.callbacks.place import PlaceCallbackFactory
-from src.db import cached_places, cached_employees_fullname_and_id, cached_admins_fullname_and_id
+from src.db import directory
 
 
 def create_admin_kb() -> InlineKeyboardMarkup:
@@ -58,7 +58,7 @@ def check_add_place() -> InlineKeyboardMarkup:
 def create_employee_list_kb() -> InlineKeyboardMarkup:
     kb = []
 
-    for fullname, user_id in cached_employees_fullname_and_id:
+    for fullname, user_id in directory.fullnames_and_ids(role="employee"):
         kb.append([
             InlineKeyboardButton(
                 text=f"{fullname}",
@@ -76,7 +76,7 @@ def create_employee_list_kb() -> InlineKeyboardMarkup:
 def create_admin_list_kb() -> InlineKeyboardMarkup:
     kb = []
 
-    for fullname, user_id in cached_admins_fullname_and_id:
+    for fullname, user_id in directory.fullnames_and_ids(role="admin"):
         kb.append([
             InlineKeyboardButton(
                 text=f"{fullname}",
@@ -94,7 +94,7 @@ def create_admin_list_kb() -> InlineKeyboardMarkup:
 def create_places_list_kb() -> InlineKeyboardMarkup:
     kb = []
 
-    for title, chat_id in cached_places.items():
+    for title, chat_id in directory.places():
         kb.append([
             InlineKeyboardButton(
                 text=f"{title}",
@@ -1,13 +1,13 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 from src.callbacks.place import PlaceCallbackFactory
-from src.db import cached_places
+from src.db import directory
 
 
 def create_places_kb() -> InlineKeyboardMarkup:
     kb = []
 
-    for title, chat_id in cached_places.items():
+    for title, chat_id in directory.places():
         kb.append([
             InlineKeyboardButton(text=title, callback_data=PlaceCallbackFactory(
                 title=title,
@@ -68,3 +68,12 @@ def create_salaries_checking_kb() -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text="➢ Отмена", callback_data="cancel")],
         ]
     )
+
+
+def create_resend_report_kb() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="Отправить отчёт ещё раз", callback_data="resend_report")],
+            [InlineKeyboardButton(text="➢ Отмена", callback_data="cancel")],
+        ]
+    )
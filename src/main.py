@@ -1,7 +1,6 @@
 import asyncio
 import logging
 import sys
-from threading import Thread
 
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.redis import RedisStorage
@@ -16,19 +15,37 @@ from handlers import (
     router_admin
 )
 
-from autoposting.check_for_revenue import (
-    creating_new_loop_for_checking_revenue,
-)
-from autoposting.send_notifications import (
-    creating_new_loop_for_notification,
-)
+from autoposting.check_for_revenue import send_revenue_report_by_N_days
+from autoposting.send_notifications import auto_posting
+from src.autoposting.scheduler import CronTrigger, Scheduler, MISSED_SKIP, MISSED_RUN_ONCE
+from src.autoposting.leader import LeaderLease
+from src.autoposting.history import JobHistory
+from src.db import directory_invalidation, directory_listener
+from src.database import async_session
+from src.middleware.db_session_middleware import DbSessionMiddleware
+from src.middleware.directory_events_middleware import DirectoryEventsMiddleware
+from src.middleware.buffered_fsm_middleware import BufferedFSMMiddleware
+from src.middleware.album_middleware import albums
+from src.middleware.rate_limit_middleware import RateLimitMiddleware
+from src.outbox import outbox_deliverer
+from src.bot_session import create_bot_session
 # from db.queries.orm import AsyncOrm
 
 
 async def main() -> None:
     # await AsyncOrm.create_tables()
 
-    bot = Bot(token=settings.TOKEN)
+    bot = Bot(token=settings.TOKEN, session=create_bot_session())
+    # все отправки в чаты (отчеты, рассылки) идут через общие лимиты и очередь на чат
+    bot.session.middleware(RateLimitMiddleware(
+        global_rate=settings.TG_GLOBAL_RATE,
+        private_chat_rate=settings.TG_PRIVATE_CHAT_RATE,
+        private_chat_burst=settings.TG_PRIVATE_CHAT_BURST,
+        group_chat_rate_per_minute=settings.TG_GROUP_CHAT_RATE_PER_MINUTE,
+        group_chat_burst=settings.TG_GROUP_CHAT_BURST,
+        global_burst=settings.TG_GLOBAL_BURST,
+        max_retries=settings.TG_MAX_RETRIES,
+    ))
     storage = RedisStorage(redis=redis)
     dp = Dispatcher(storage=storage)
 
@@ -41,6 +58,26 @@ async def main() -> None:
         filemode="w",
     )
 
+    # Загружаем справочник (точки, сотрудники, админы) одним запросом
+    # и подписываемся на его изменения из других процессов бота
+    directory_invalidation_task = await directory_invalidation.start()
+    # а также на изменения, сделанные напрямую в БД
+    directory_listener_task = asyncio.create_task(directory_listener.run())
+
+    # Отчеты сотрудников доставляются в чаты точек в фоне из таблицы report_outbox
+    outbox_task = asyncio.create_task(outbox_deliverer.run(bot))
+
+    # Изменения справочника публикуются другим процессам только после коммита
+    dp.update.outer_middleware(DirectoryEventsMiddleware(invalidation=directory_invalidation))
+    # Одна сессия БД на апдейт
+    dp.update.outer_middleware(DbSessionMiddleware(session_pool=async_session))
+    # Изменения FSM за апдейт записываются в Redis одной транзакцией
+    dp.update.outer_middleware(BufferedFSMMiddleware())
+    # Один сборщик альбомов на все флоу (см. albums.register_flow в хендлерах)
+    dp.message.outer_middleware(albums)
+    # состояние буфера альбомов каждого процесса периодически пишется в лог
+    albums_stats_task = asyncio.create_task(albums.log_stats(settings.ALBUM_STATS_INTERVAL_SECONDS))
+
     # Подключаем роутеры к корневому роутеру (диспетчеру)
     dp.include_router(router_authorise)
     dp.include_router(router_start_shift)
@@ -52,11 +89,29 @@ async def main() -> None:
     await set_default_commands(bot)
     await bot.delete_webhook(drop_pending_updates=True)
 
-    global_loop = asyncio.get_event_loop()
-    auto_posting_thread = Thread(target=creating_new_loop_for_notification, args=(global_loop, bot))
-    auto_checking_revenue_thread = Thread(target=creating_new_loop_for_checking_revenue, args=(global_loop, bot))
-    auto_posting_thread.start()
-    auto_checking_revenue_thread.start()
+    # Фоновые задачи по расписанию в том же event loop, что и бот;
+    # при нескольких копиях бота их выполняет только ведущая
+    leader = LeaderLease(redis, ttl_seconds=settings.SCHEDULER_LEADER_TTL_SECONDS)
+    leader_task = asyncio.create_task(leader.run())
+    # история запусков в job_runs; пропущенные за время простоя запуски выполняются при старте
+    scheduler = Scheduler(leader=leader, history=JobHistory(session_pool=async_session))
+    scheduler.add_job(
+        "notification",
+        lambda: auto_posting(bot),
+        CronTrigger(settings.NOTIFICATION_CRON),
+        jitter_seconds=settings.SCHEDULER_JITTER_SECONDS,
+        # опоздавшее больше чем на час напоминание уже бесполезно
+        missed_policy=MISSED_SKIP,
+        misfire_grace_seconds=60 * 60,
+    )
+    scheduler.add_job(
+        "revenue_check",
+        lambda: send_revenue_report_by_N_days(bot),
+        CronTrigger(settings.REVENUE_CHECK_CRON),
+        jitter_seconds=settings.SCHEDULER_JITTER_SECONDS,
+        missed_policy=MISSED_RUN_ONCE,
+    )
+    scheduler_task = asyncio.create_task(scheduler.run())
 
     print("Бот успешно запущен!", file=sys.stderr)
     await dp.start_polling(bot)
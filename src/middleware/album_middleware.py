@@ -1,21 +1,106 @@
 import asyncio
-from typing import Callable, Any, Awaitable, Dict
+import logging
+from typing import Callable, Any, Awaitable, Dict, NamedTuple, Optional, Type, Union
 
 from aiogram import BaseMiddleware, F
+from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, TelegramObject
 
-from cachetools import TTLCache
+from src.config import settings
+from src.middleware.album_storage import MemoryAlbumStorage, RedisAlbumStorage, create_album_storage
+
+logger = logging.getLogger(__name__)
+
+AlbumStorage = Union[MemoryAlbumStorage, RedisAlbumStorage]
+
+
+class AlbumStep(NamedTuple):
+    # поле в данных FSM, куда пишутся file_id альбома;
+    # None - на этом шаге альбом не принимается, нужно одно фото
+    field: Optional[str]
+    photos_only: bool = True
+
+
+class AlbumFlow(NamedTuple):
+    # настройки сборки альбомов для одной группы состояний (флоу)
+    wait_time_seconds: float
+    quiet_window_seconds: float
 
 
 class AlbumsMiddleware(BaseMiddleware):
-    def __init__(self, wait_time_seconds: int):
+    """
+    Собирает сообщения одного media_group_id в альбом.
+
+    Подключается один раз на диспетчер (dp.message.outer_middleware), поэтому
+    буфер альбомов общий для всех флоу. Сообщения без media_group_id и альбомы
+    в состояниях, которые не зарегистрированы ни одним флоу, сразу уходят дальше.
+
+    Первое сообщение группы становится ведущим: оно ждет, пока альбом
+    соберется, и одно проходит дальше в хендлер. Остальные сообщения только
+    дописываются в альбом и сразу возвращаются, не занимая ни таймеров,
+    ни общих блокировок. Где лежат альбомы (в памяти процесса или в Redis),
+    решает storage, по умолчанию - настройка ALBUM_STORAGE.
+
+    Альбом считается собранным, как только в течение quiet_window_seconds
+    не пришло ни одного нового сообщения из этой группы, но не позже
+    wait_time_seconds после первого сообщения.
+
+    Что делать с собранным альбомом, определяется шагом FSM: флоу регистрирует
+    себя через register_flow() и свои фото-шаги через register(), а middleware
+    читает состояние один раз и одним update_data сохраняет file_id в поле этого шага.
+    """
+
+    def __init__(
+            self,
+            wait_time_seconds: float = 2.0,
+            quiet_window_seconds: float = 0.3,
+            storage: Optional[AlbumStorage] = None,
+    ):
         super().__init__()
         self.wait_time_seconds = wait_time_seconds
-        self.albums_cache = TTLCache(
-            ttl=float(wait_time_seconds) + 20.0,
-            maxsize=1000
+        self.quiet_window_seconds = quiet_window_seconds
+        self.storage = storage or create_album_storage(ttl=60.0)
+        self.flows: Dict[str, AlbumFlow] = {}
+        self.steps: Dict[str, AlbumStep] = {}
+
+    def register_flow(
+            self,
+            group: Type[StatesGroup],
+            wait_time_seconds: Optional[float] = None,
+            quiet_window_seconds: Optional[float] = None,
+    ) -> None:
+        # во всех состояниях флоу альбом доходит до хендлера одним апдейтом
+        self.flows[group.__full_group_name__] = AlbumFlow(
+            wait_time_seconds=wait_time_seconds or self.wait_time_seconds,
+            quiet_window_seconds=quiet_window_seconds or self.quiet_window_seconds,
         )
-        self.lock = asyncio.Lock()
+
+    def register(self, state: State, field: Optional[str], photos_only: bool = True) -> None:
+        if state.group.__full_group_name__ not in self.flows:
+            self.register_flow(state.group)
+
+        self.steps[state.state] = AlbumStep(field=field, photos_only=photos_only)
+
+    def stats(self) -> Dict[str, int]:
+        # размер буфера альбомов и счетчики вытеснения, см. storage.stats()
+        return self.storage.stats()
+
+    async def log_stats(self, interval_seconds: float) -> None:
+        # раз в interval_seconds пишет stats() в лог; в main.py логируется
+        # только warning и выше, поэтому строка пишется с этим уровнем
+        evicted = 0
+
+        while True:
+            await asyncio.sleep(interval_seconds)
+            stats = self.stats()
+
+            # вытеснение альбомов из переполненного буфера означает потерянные фото
+            if stats.get("evicted", 0) > evicted:
+                logger.warning("Буфер альбомов переполнен, часть альбомов вытеснена: %s", stats)
+            else:
+                logger.warning("Буфер альбомов: %s", stats)
+
+            evicted = stats.get("evicted", 0)
 
     async def __call__(
             self,
@@ -23,121 +108,54 @@ class AlbumsMiddleware(BaseMiddleware):
             event: TelegramObject,
             data: Dict[str, Any],
     ) -> Any:
-        if not isinstance(event, Message):
-            print("%s used not for Message, but for %s", self.__class__.__name__, type(event))
+        # If there is no media_group
+        # just pass update further
+        if not isinstance(event, Message) or event.media_group_id is None:
             return await handler(event, data)
 
         event: Message
 
-        # If there is no media_group
-        # just pass update further
-        if event.media_group_id is None:
+        raw_state = data["raw_state"] if "raw_state" in data else await data["state"].get_state()
+        flow = self.flows.get(raw_state.rsplit(":", 1)[0]) if raw_state else None
+
+        if flow is None:
             return await handler(event, data)
 
         album_id: str = event.media_group_id
 
-        async with self.lock:
-            self.albums_cache.setdefault(album_id, list())
-            self.albums_cache[album_id].append(event)
+        if not await self.storage.add(album_id, event):
+            return
+
+        # апдейты обрабатываются конкурентно и могут прийти не по порядку
+        items = sorted(
+            await self.storage.collect(album_id, flow.wait_time_seconds, flow.quiet_window_seconds),
+            key=lambda item: item.message_id,
+        )
 
-        # Wait for some time until other updates are collected
-        await asyncio.sleep(self.wait_time_seconds)
+        step = self.steps.get(raw_state)
 
-        # Find the smallest message_id in batch, this will be our only update
-        # which will pass to handlers
-        my_message_id = smallest_message_id = event.message_id
+        context: F = data["state"]
+        context.album = items
 
-        item: Message
-        for item in self.albums_cache[album_id]:
-            smallest_message_id = min(smallest_message_id, item.message_id)
+        if step is None:
+            return await handler(event, data)
 
-        # If current message_id in not the smallest, drop the update;
-        # it's already saved in self.albums_cache
-        if my_message_id != smallest_message_id:
+        # Если на этом шаге нужно одно фото, то скипаем апдейт
+        if step.field is None:
+            await event.answer(text="Нужно прислать одно фото!")
             return
 
-        # Если сотрудник прислал более одного фото, то скипаем апдейт
-        if str(await data["state"].get_state()).split(":")[-1] == "employee_photo":
-            await event.answer(text="Нужно прислать одно фото!")
+        if step.photos_only and any(item.is_video or item.file_id is None for item in items):
+            await event.answer(text="Нужны только фото!")
             return
 
-        context: F = data["state"]
-        context.album = self.albums_cache[album_id]
-
-        # обрабатывается ситуация, когда человек прислал несколько фотографий павильона
-        if str(await data["state"].get_state()).split(":")[-1] == "working_place_photo":
-            for info in context.album:
-                if info.video:
-                    await event.answer(text="Нужны только фото!")
-                    return
-
-            await data["state"].update_data(working_place_photo=[photo.photo[-1].file_id for photo in context.album])
-
-        # обрабатывается ситуация, когда человек прислал несколько фотографий раздевалки
-        if str(await data["state"].get_state()).split(":")[-1] == "cloakroom_photo":
-            for info in context.album:
-                if info.video:
-                    await event.answer(text="Нужны только фото!")
-                    return
-
-            await data["state"].update_data(cloakroom_photo=[photo.photo[-1].file_id for photo in context.album])
-
-        # обрабатывается ситуация, когда человек прислал несколько фотографий дефектов на коньках
-        if str(await data["state"].get_state()).split(":")[-1] == "defects_photo":
-            for info in context.album:
-                if info.video:
-                    await event.answer(text="Нужны только фото!")
-                    return
-
-            await data["state"].update_data(defects_photo=[photo.photo[-1].file_id for photo in context.album])
-
-        # обрабатывается ситуация, когда человек прислал несколько фотографий дефектов у пингвинов
-        if str(await data["state"].get_state()).split(":")[-1] == "penguins_defects_photo":
-            for info in context.album:
-                if info.video:
-                    await event.answer(text="Нужны только фото!")
-                    return
-
-            await data["state"].update_data(penguins_defects_photo=[photo.photo[-1].file_id for photo in context.album])
-
-        # обрабатывается ситуация, когда человек прислал несколько фотографий дефектов у ящиков хранения
-        if str(await data["state"].get_state()).split(":")[-1] == "boxes_defects_photo":
-            for info in context.album:
-                if info.video:
-                    await event.answer(text="Нужны только фото!")
-                    return
-
-            await data["state"].update_data(
-                boxes_defects_photo=[photo.photo[-1].file_id for photo in context.album])
-
-        # обрабатывается ситуация, когда человек прислал несколько фотографий дефектов защиты
-        if str(await data["state"].get_state()).split(":")[-1] == "depend_defects_photo":
-            for info in context.album:
-                if info.video:
-                    await event.answer(text="Нужны только фото!")
-                    return
-
-            await data["state"].update_data(
-                depend_defects_photo=[photo.photo[-1].file_id for photo in context.album])
-
-        # обрабатывается ситуация, когда человек прислал несколько фотографий чеков
-        if str(await data["state"].get_state()).split(":")[-1] == "receipts_photo":
-            for info in context.album:
-                if info.video:
-                    await event.answer(text="Нужны только фото!")
-                    return
-
-            await data["state"].update_data(
-                receipts_photo=[photo.photo[-1].file_id for photo in context.album])
-
-        # обрабатывается ситуация, когда человек прислал несколько фотографий льготников
-        if str(await data["state"].get_state()).split(":")[-1] == "benefits_photo":
-            for info in context.album:
-                if info.video:
-                    await event.answer(text="Нужны только фото!")
-                    return
-
-            await data["state"].update_data(
-                benefits_photo=[photo.photo[-1].file_id for photo in context.album])
+        await context.update_data({step.field: [item.file_id for item in items]})
 
         return await handler(event, data)
+
+
+# общий для всех флоу экземпляр, подключается в main.py
+albums = AlbumsMiddleware(
+    wait_time_seconds=settings.ALBUM_WAIT_SECONDS,
+    quiet_window_seconds=settings.ALBUM_QUIET_WINDOW_SECONDS,
+)
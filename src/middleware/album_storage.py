@@ -0,0 +1,182 @@
+import asyncio
+import json
+from typing import Dict, List, Optional
+
+from aiogram.types import Message
+from cachetools import TTLCache
+from redis.asyncio import Redis
+
+from src.config import settings, redis
+
+
+class AlbumItem:
+    """
+    Из сообщения альбома нужны только id, file_id и признак видео,
+    поэтому целый Message (pydantic-модель со всеми полями) не храним.
+    """
+
+    __slots__ = ("message_id", "file_id", "is_video")
+
+    def __init__(self, message_id: int, file_id: Optional[str], is_video: bool):
+        self.message_id = message_id
+        self.file_id = file_id
+        self.is_video = is_video
+
+    @classmethod
+    def from_message(cls, message: Message) -> "AlbumItem":
+        if message.video:
+            return cls(message_id=message.message_id, file_id=message.video.file_id, is_video=True)
+        if message.photo:
+            return cls(message_id=message.message_id, file_id=message.photo[-1].file_id, is_video=False)
+
+        return cls(message_id=message.message_id, file_id=None, is_video=False)
+
+    def dumps(self) -> str:
+        return json.dumps([self.message_id, self.file_id, self.is_video])
+
+    @classmethod
+    def loads(cls, raw) -> "AlbumItem":
+        message_id, file_id, is_video = json.loads(raw)
+        return cls(message_id=message_id, file_id=file_id, is_video=is_video)
+
+
+class _AlbumsCache(TTLCache):
+    # TTLCache, который считает альбомы, вытесненные при переполнении
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.evicted = 0
+
+    def popitem(self):
+        self.evicted += 1
+        return super().popitem()
+
+
+class _Album:
+    __slots__ = ("items", "changed")
+
+    def __init__(self):
+        self.items: List[AlbumItem] = []
+        self.changed = asyncio.Event()  # пришло новое сообщение альбома
+
+
+class MemoryAlbumStorage:
+    """
+    Альбомы в памяти процесса. Подходит, пока все апдейты
+    одной media group обрабатывает один процесс бота.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1000):
+        self.albums_cache = _AlbumsCache(ttl=ttl, maxsize=maxsize)
+        self.albums_started = 0
+
+    async def add(self, album_id: str, message: Message) -> bool:
+        # между чтением и записью кэша нет await, поэтому
+        # ведущий у альбома всегда ровно один и блокировка не нужна
+        album = self.albums_cache.get(album_id)
+
+        if album is not None:
+            album.items.append(AlbumItem.from_message(message))
+            album.changed.set()
+            return False
+
+        album = self.albums_cache[album_id] = _Album()
+        album.items.append(AlbumItem.from_message(message))
+        self.albums_started += 1
+        return True
+
+    async def collect(self, album_id: str, wait_time_seconds: float, quiet_window_seconds: float) -> List[AlbumItem]:
+        album: _Album = self.albums_cache[album_id]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait_time_seconds
+
+        while True:
+            timeout = min(quiet_window_seconds, deadline - loop.time())
+            if timeout <= 0:
+                break
+
+            album.changed.clear()
+            try:
+                await asyncio.wait_for(album.changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break  # тишина - альбом пришел целиком
+
+        return list(album.items)
+
+    def stats(self) -> Dict[str, int]:
+        size = self.albums_cache.currsize
+
+        # альбомы не удаляются из кэша явно, поэтому все,
+        # что не лежит в нем и не было вытеснено, ушло по TTL
+        return {
+            "size": size,
+            "started": self.albums_started,
+            "expired": self.albums_started - self.albums_cache.evicted - size,
+            "evicted": self.albums_cache.evicted,
+        }
+
+
+class RedisAlbumStorage:
+    """
+    Альбомы в Redis, общие для всех процессов бота: сообщения группы
+    дописываются в список album:<id>:messages, а ведущим становится тот,
+    кто первым выставил album:<id>:leader через SET NX. Так альбом не
+    разваливается на части, даже если его сообщения попали в разные процессы.
+    """
+
+    def __init__(self, redis: Redis, ttl: float, prefix: str = "album"):
+        self._redis = redis
+        self._ttl_ms = int(ttl * 1000)
+        self._prefix = prefix
+        self.albums_started = 0
+
+    def _keys(self, album_id: str):
+        return f"{self._prefix}:{album_id}:messages", f"{self._prefix}:{album_id}:leader"
+
+    async def add(self, album_id: str, message: Message) -> bool:
+        messages_key, leader_key = self._keys(album_id)
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(leader_key, 1, nx=True, px=self._ttl_ms)
+            pipe.rpush(messages_key, AlbumItem.from_message(message).dumps())
+            pipe.pexpire(messages_key, self._ttl_ms)
+            is_leader, _, _ = await pipe.execute()
+
+        if is_leader:
+            self.albums_started += 1
+
+        return bool(is_leader)
+
+    async def collect(self, album_id: str, wait_time_seconds: float, quiet_window_seconds: float) -> List[AlbumItem]:
+        messages_key, _ = self._keys(album_id)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait_time_seconds
+
+        # чужие процессы не могут разбудить нас событием,
+        # поэтому длину списка опрашиваем несколько раз за окно тишины
+        poll_interval = max(quiet_window_seconds / 3, 0.05)
+        length = await self._redis.llen(messages_key)
+        quiet_since = loop.time()
+
+        while loop.time() < deadline and loop.time() - quiet_since < quiet_window_seconds:
+            await asyncio.sleep(min(poll_interval, max(deadline - loop.time(), 0)))
+
+            new_length = await self._redis.llen(messages_key)
+            if new_length != length:
+                length, quiet_since = new_length, loop.time()
+
+        return [AlbumItem.loads(raw) for raw in await self._redis.lrange(messages_key, 0, -1)]
+
+    def stats(self) -> Dict[str, int]:
+        # альбомы живут в Redis и удаляются по TTL самим Redis
+        return {"started": self.albums_started}
+
+
+def create_album_storage(ttl: float, backend: Optional[str] = None):
+    backend = backend or settings.ALBUM_STORAGE
+
+    if backend == "redis":
+        return RedisAlbumStorage(redis=redis, ttl=ttl)
+    if backend == "memory":
+        return MemoryAlbumStorage(ttl=ttl)
+
+    raise ValueError(f"Unknown album storage: {backend}")
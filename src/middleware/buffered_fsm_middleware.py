@@ -0,0 +1,164 @@
+from copy import deepcopy
+from typing import Callable, Any, Awaitable, Dict, Optional, Set
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.types import TelegramObject
+from redis.exceptions import WatchError
+
+
+class BufferedFSMContext(FSMContext):
+    """
+    FSMContext, который не ходит в хранилище на каждый вызов.
+
+    Состояние уже прочитано FSMContextMiddleware (raw_state), данные читаются
+    один раз при первом обращении, а set_state/set_data/update_data/clear
+    только меняют копию в памяти. Все изменения записываются одним flush()
+    после хендлера.
+
+    Пока хендлер ждет Telegram, другой апдейт того же пользователя (двойное
+    нажатие, фото альбома, колбэк) может успеть записать свои данные. Поэтому
+    ключи, измененные через update_data, при записи накладываются на данные,
+    которые лежат в хранилище в этот момент, а не на прочитанную в начале копию.
+    Для RedisStorage чтение и запись идут в одной транзакции с WATCH на ключ
+    данных и повторяются, если ключ успели изменить. Для остальных хранилищ
+    используются их обычные методы, без транзакции, так что между чтением
+    и записью остается короткое окно для гонки. set_data и clear заменяют
+    данные целиком, изменения других апдейтов при этом не сохраняются;
+    одновременная запись одного и того же ключа - тоже (побеждает последний).
+    """
+
+    def __init__(self, storage: BaseStorage, key: StorageKey, raw_state: Optional[str] = None):
+        super().__init__(storage=storage, key=key)
+        self._state = raw_state
+        self._data: Optional[Dict[str, Any]] = None
+        self._state_changed = False
+        self._data_changed = False
+        self._data_replaced = False  # set_data/clear: данные записываются целиком
+        self._updated_keys: Set[str] = set()
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_changed = True
+
+    async def get_state(self) -> Optional[str]:
+        return self._state
+
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        self._data = deepcopy(data)
+        self._data_changed = True
+        self._data_replaced = True
+
+    async def get_data(self) -> Dict[str, Any]:
+        # как и хранилище, отдаем копию: правки результата не должны попасть в данные
+        return deepcopy(await self._load_data())
+
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        if data:
+            kwargs.update(data)
+
+        current = await self._load_data()
+        current.update(deepcopy(kwargs))
+        self._data_changed = True
+        self._updated_keys.update(kwargs)
+
+        return deepcopy(current)
+
+    async def _load_data(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = await self.storage.get_data(key=self.key)
+        return self._data
+
+    async def flush(self) -> None:
+        if not self._state_changed and not self._data_changed:
+            return
+
+        if isinstance(self.storage, RedisStorage):
+            await self._flush_redis(self.storage)
+        else:
+            if self._state_changed:
+                await self.storage.set_state(key=self.key, state=self._state)
+            if self._data_changed:
+                data = self._data
+                if not self._data_replaced:
+                    data = self._merge(await self.storage.get_data(key=self.key))
+                await self.storage.set_data(key=self.key, data=data)
+
+        self._state_changed = self._data_changed = self._data_replaced = False
+        self._updated_keys.clear()
+
+    def _merge(self, current: Dict[str, Any]) -> Dict[str, Any]:
+        # ключи, измененные этим апдейтом, поверх данных, записанных другими апдейтами
+        current.update({key: self._data[key] for key in self._updated_keys})
+        return current
+
+    async def _flush_redis(self, storage: RedisStorage) -> None:
+        # те же ключи, TTL и сериализация, что у RedisStorage.set_state/set_data
+        state_key = storage.key_builder.build(self.key, "state")
+        data_key = storage.key_builder.build(self.key, "data")
+        merge = self._data_changed and not self._data_replaced
+
+        async with storage.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    data = self._data
+                    if merge:
+                        # если ключ данных изменится до EXEC, транзакция не выполнится
+                        await pipe.watch(data_key)
+                        raw = await pipe.get(data_key)
+                        if isinstance(raw, bytes):
+                            raw = raw.decode("utf-8")
+                        data = self._merge(storage.json_loads(raw) if raw else {})
+                        pipe.multi()
+
+                    if self._state_changed:
+                        if self._state is None:
+                            pipe.delete(state_key)
+                        else:
+                            pipe.set(state_key, self._state, ex=storage.state_ttl)
+
+                    if self._data_changed:
+                        if not data:
+                            pipe.delete(data_key)
+                        else:
+                            pipe.set(data_key, storage.json_dumps(data), ex=storage.data_ttl)
+
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    # данные изменил другой апдейт - перечитываем и накладываем заново
+                    continue
+
+
+class BufferedFSMMiddleware(BaseMiddleware):
+    """
+    Подменяет FSMContext апдейта на BufferedFSMContext и записывает его
+    изменения в хранилище после хендлера. Шаг анкеты (get_data, update_data,
+    set_state) стоит один запрос к Redis на чтение данных и один на запись
+    вместо отдельного запроса на каждый вызов.
+
+    Регистрируется как outer-middleware апдейтов после создания Dispatcher,
+    то есть внутри его FSMContextMiddleware, где state и raw_state уже есть.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        context: Optional[FSMContext] = data.get("state")
+        if context is None:
+            return await handler(event, data)
+
+        buffered = BufferedFSMContext(storage=context.storage, key=context.key, raw_state=data.get("raw_state"))
+        data["state"] = buffered
+
+        try:
+            return await handler(event, data)
+        finally:
+            # изменения, сделанные до ошибки в хендлере, сохраняются, как и без буфера
+            await buffered.flush()
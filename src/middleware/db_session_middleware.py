@@ -0,0 +1,43 @@
+from typing import Callable, Any, Awaitable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД на апдейт: хендлеры получают её аргументом session
+    и передают в методы AsyncOrm, а коммит (или откат) выполняется здесь один раз.
+
+    Соединение из пула берется только при первом запросе, поэтому апдейты,
+    которые не ходят в БД, ничего не стоят.
+
+    Транзакция держит соединение, пока ее не закоммитят, а запросы к Telegram
+    (ответы, альбомы, запись FSM) могут ждать секунды. Поэтому хендлер
+    заканчивает работу с БД и сам вызывает session.commit() до первого
+    запроса к Telegram; коммит здесь тогда ничего не делает, а соединение
+    не простаивает в пуле "idle in transaction".
+    """
+
+    def __init__(self, session_pool: async_sessionmaker):
+        super().__init__()
+        self.session_pool = session_pool
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        async with self.session_pool() as session:
+            data["session"] = session
+
+            try:
+                result = await handler(event, data)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+            return result
@@ -0,0 +1,31 @@
+from typing import Callable, Any, Awaitable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from src.db.invalidation import DirectoryInvalidation
+
+
+class DirectoryEventsMiddleware(BaseMiddleware):
+    """
+    Публикует изменения справочника, сделанные хендлером, другим процессам
+    бота только после коммита транзакции апдейта (в хендлере или в
+    DbSessionMiddleware). Если транзакция откатилась, другие процессы ничего
+    не узнают, а локальный справочник перечитывается из БД.
+
+    Регистрируется как outer-middleware апдейтов перед DbSessionMiddleware,
+    чтобы коммит выполнялся внутри него.
+    """
+
+    def __init__(self, invalidation: DirectoryInvalidation):
+        super().__init__()
+        self.invalidation = invalidation
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        async with self.invalidation.publish_after():
+            return await handler(event, data)
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, Optional, Union
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMediaGroup, TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+# методы, которые Telegram считает отправкой сообщения в чат
+_SENDING_PREFIXES = ("send", "copy", "forward")
+
+
+class TokenBucket:
+    """
+    Классическое ведро токенов: rate токенов в секунду, не больше capacity
+    в запасе. acquire() ждет, пока накопится нужное количество токенов.
+
+    За любой отрезок времени T ведро пропускает не больше capacity + rate * T
+    токенов (плюс стоимость одного альбома сверх запаса), поэтому для лимита
+    "N за окно" rate нужно уменьшать на величину запаса, а для точного - см. SlidingWindow.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = asyncio.get_running_loop().time()
+
+    def _refill(self) -> None:
+        now = asyncio.get_running_loop().time()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+    async def acquire(self, cost: float = 1.0) -> None:
+        # альбом дороже запаса ведра не должен ждать вечно: ждем полного ведра
+        # и уходим в минус, так что следующие запросы отработают этот долг
+        need = min(cost, self.capacity)
+
+        while True:
+            self._refill()
+            if self._tokens >= need:
+                self._tokens -= cost
+                return
+
+            await asyncio.sleep((need - self._tokens) / self.rate)
+
+
+class SlidingWindow:
+    """
+    Не больше limit отправок за любые window_seconds секунд подряд.
+    Хранит время последних отправок, поэтому годится для маленьких лимитов
+    (20 сообщений в минуту в группу), а не для общего потока бота.
+    """
+
+    def __init__(self, limit: int, window_seconds: float):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._sent: Deque[float] = deque()
+
+    def _expire(self, now: float) -> None:
+        while self._sent and self._sent[0] <= now - self.window_seconds:
+            self._sent.popleft()
+
+    def is_empty(self) -> bool:
+        self._expire(asyncio.get_running_loop().time())
+        return not self._sent
+
+    async def acquire(self, cost: int = 1) -> None:
+        loop = asyncio.get_running_loop()
+        cost = min(cost, self.limit)
+
+        while True:
+            now = loop.time()
+            self._expire(now)
+
+            if len(self._sent) + cost <= self.limit:
+                self._sent.extend([now] * cost)
+                return
+
+            # ждем, пока из окна выйдет столько отправок, сколько не хватает
+            oldest = self._sent[len(self._sent) + cost - self.limit - 1]
+            await asyncio.sleep(oldest + self.window_seconds - now)
+
+
+class _ChatQueue:
+    __slots__ = ("lock", "bucket", "window", "users")
+
+    def __init__(self, bucket: TokenBucket, window: Optional[SlidingWindow] = None):
+        self.lock = asyncio.Lock()  # asyncio.Lock отдает блокировку в порядке очереди - это и есть FIFO чата
+        self.bucket = bucket
+        self.window = window
+        self.users = 0
+
+    def is_idle(self) -> bool:
+        return self.users == 0 and self.bucket.is_full() and (self.window is None or self.window.is_empty())
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: все исходящие отправки в чаты проходят через него,
+    откуда бы их ни вызвали (отчеты из флоу, рассылки, автопостинг).
+
+    - в каждом чате запросы выполняются строго по очереди, в порядке вызова;
+    - у каждого чата свое ведро токенов: личные чаты и группы
+      ограничиваются по-разному, альбом стоит столько, сколько в нем элементов;
+    - общее ведро держит суммарную скорость бота ниже глобального лимита;
+    - в группе сообщения идут с паузами (запас ведра - group_chat_burst), а окно
+      SlidingWindow гарантирует не больше group_chat_rate_per_minute сообщений
+      за любые 60 с, в том числе с альбомами;
+    - у общего ведра запас global_burst, а скорость пополнения уменьшена на его
+      величину, чтобы за секунду уходило не больше global_rate сообщений;
+    - на TelegramRetryAfter запрос повторяется после паузы, которую назвал Telegram.
+
+    Остальные методы (getUpdates, answerCallbackQuery, ...) проходят без ожидания.
+    """
+
+    def __init__(
+            self,
+            global_rate: float = 30.0,
+            private_chat_rate: float = 1.0,
+            private_chat_burst: float = 3.0,
+            group_chat_rate_per_minute: float = 20.0,
+            group_chat_burst: float = 1.0,
+            global_burst: float = 1.0,
+            max_retries: int = 3,
+    ):
+        if not 0 < group_chat_burst <= group_chat_rate_per_minute:
+            raise ValueError("group_chat_burst must be positive and not greater than group_chat_rate_per_minute")
+        if not 0 < global_burst < global_rate:
+            raise ValueError("global_burst must be positive and less than global_rate")
+
+        self.global_rate = global_rate
+        self.private_chat_rate = private_chat_rate
+        self.private_chat_burst = private_chat_burst
+        self.group_chat_rate_per_minute = group_chat_rate_per_minute
+        self.group_chat_burst = group_chat_burst
+        self.global_burst = global_burst
+        self.max_retries = max_retries
+
+        self._chats: Dict[Union[int, str], _ChatQueue] = {}
+        self._global_bucket = None
+        self._global_lock = None
+
+    def _chat_queue(self, chat_id: Union[int, str]) -> _ChatQueue:
+        queue = self._chats.get(chat_id)
+
+        if queue is None:
+            # отрицательные id и @username - группы и каналы
+            if isinstance(chat_id, str) or chat_id < 0:
+                queue = _ChatQueue(
+                    bucket=TokenBucket(rate=self.group_chat_rate_per_minute / 60, capacity=self.group_chat_burst),
+                    window=SlidingWindow(limit=int(self.group_chat_rate_per_minute), window_seconds=60),
+                )
+            else:
+                queue = _ChatQueue(TokenBucket(rate=self.private_chat_rate, capacity=self.private_chat_burst))
+
+            self._chats[chat_id] = queue
+
+        return queue
+
+    async def _acquire_global(self, cost: float) -> None:
+        # ведро и блокировку создаем уже внутри event loop
+        if self._global_bucket is None:
+            self._global_bucket = TokenBucket(
+                rate=self.global_rate - self.global_burst,
+                capacity=self.global_burst,
+            )
+            self._global_lock = asyncio.Lock()
+
+        async with self._global_lock:
+            await self._global_bucket.acquire(cost)
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: "Bot",
+            method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+
+        if chat_id is None or not method.__api_method__.startswith(_SENDING_PREFIXES):
+            return await make_request(bot, method)
+
+        cost = float(len(method.media)) if isinstance(method, SendMediaGroup) else 1.0
+        queue = self._chat_queue(chat_id)
+        queue.users += 1
+
+        try:
+            async with queue.lock:
+                attempt = 0
+
+                while True:
+                    await queue.bucket.acquire(cost)
+                    if queue.window is not None:
+                        await queue.window.acquire(int(cost))
+                    await self._acquire_global(cost)
+
+                    try:
+                        return await make_request(bot, method)
+                    except TelegramRetryAfter as e:
+                        attempt += 1
+                        if attempt > self.max_retries:
+                            raise
+
+                        logger.warning(
+                            "Flood control в чате %s на %s, повтор через %s с",
+                            chat_id, method.__api_method__, e.retry_after,
+                        )
+                        # блокировку чата не отпускаем, чтобы следующие сообщения не обогнали это
+                        await asyncio.sleep(e.retry_after)
+        finally:
+            queue.users -= 1
+
+            # простаивающий чат с полным ведром и пустым окном ничем не отличается от нового
+            if queue.is_idle():
+                self._chats.pop(chat_id, None)
@@ -6,7 +6,7 @@ from sqlalchemy import pool
 from alembic import context
 
 from src.database import Base
-from src.db.queries.models.models import Employees, Places, Finances, Reports
+from src.db.queries.models.models import Employees, Places, Finances, Reports, ReportDailyRollups, ReportOutbox, JobRuns
 from src.config import settings
 
 # this is the Alembic Config object, which provides
@@ -0,0 +1,61 @@
+"""directory notify triggers
+
+Revision ID: 7c1e5b9a0d43
+Revises: 42fd6acf8739
+Create Date: 2024-06-20 18:42:11.503217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e5b9a0d43'
+down_revision: Union[str, None] = '42fd6acf8739'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # при любом изменении employees/places отправляем NOTIFY в канал directory_changes,
+    # его слушает src.db.listener.DirectoryListener
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_directory_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify(
+                'directory_changes',
+                json_build_object(
+                    'table', TG_TABLE_NAME,
+                    'op', TG_OP,
+                    'old', CASE WHEN TG_OP IN ('UPDATE', 'DELETE') THEN row_to_json(OLD) END,
+                    'new', CASE WHEN TG_OP IN ('INSERT', 'UPDATE') THEN row_to_json(NEW) END
+                )::text
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER employees_notify_directory_change
+        AFTER INSERT OR UPDATE OR DELETE ON employees
+        FOR EACH ROW EXECUTE FUNCTION notify_directory_change();
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER places_notify_directory_change
+        AFTER INSERT OR UPDATE OR DELETE ON places
+        FOR EACH ROW EXECUTE FUNCTION notify_directory_change();
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS places_notify_directory_change ON places;")
+    op.execute("DROP TRIGGER IF EXISTS employees_notify_directory_change ON employees;")
+    op.execute("DROP FUNCTION IF EXISTS notify_directory_change();")
@@ -0,0 +1,26 @@
+"""report outbox claimed by
+
+Revision ID: a6c4e1d8b932
+Revises: f5a9d2c71b38
+Create Date: 2024-07-12 11:26:05.418734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c4e1d8b932'
+down_revision: Union[str, None] = 'f5a9d2c71b38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('report_outbox', sa.Column('claimed_by', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('report_outbox', 'claimed_by')
@@ -0,0 +1,69 @@
+"""reporting indexes
+
+Revision ID: b4d2e8f61a07
+Revises: 7c1e5b9a0d43
+Create Date: 2024-06-27 21:05:48.114902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d2e8f61a07'
+down_revision: Union[str, None] = '7c1e5b9a0d43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+_INDEXES = [
+    ('ix_reports_place_id_report_date', 'reports', ['place_id', 'report_date'], False),
+    ('ix_reports_user_id_report_date', 'reports', ['user_id', 'report_date'], False),
+    ('ix_places_title', 'places', ['title'], True),
+    ('ix_employees_role', 'employees', ['role'], False),
+]
+
+
+def _drop_invalid_index(name: str, table: str) -> None:
+    # после прерванной или упавшей сборки CONCURRENTLY индекс остается в pg_index
+    # с indisvalid = false; IF NOT EXISTS посчитал бы его готовым, поэтому удаляем
+    invalid = op.get_bind().execute(
+        sa.text(
+            "SELECT NOT i.indisvalid FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+        ),
+        {"name": name},
+    ).scalar()
+    if invalid:
+        op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def upgrade() -> None:
+    # уникальный индекс не построится, если названия точек уже повторяются,
+    # а неудачный CREATE INDEX CONCURRENTLY оставляет за собой INVALID-индекс
+    duplicates = op.get_bind().execute(
+        sa.text("SELECT title FROM places GROUP BY title HAVING count(*) > 1")
+    ).scalars().all()
+    if duplicates:
+        raise RuntimeError(f"Названия точек повторяются, переименуйте их перед миграцией: {duplicates}")
+
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции,
+    # зато он не блокирует запись в таблицы во время построения
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in _INDEXES:
+            _drop_invalid_index(name, table)
+            op.create_index(
+                name, table, columns,
+                unique=unique, postgresql_concurrently=True, if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_employees_role', table_name='employees', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_places_title', table_name='places', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_reports_user_id_report_date', table_name='reports', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_reports_place_id_report_date', table_name='reports', postgresql_concurrently=True, if_exists=True)
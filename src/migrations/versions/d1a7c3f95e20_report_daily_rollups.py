@@ -0,0 +1,57 @@
+"""report daily rollups
+
+Revision ID: d1a7c3f95e20
+Revises: b4d2e8f61a07
+Create Date: 2024-06-29 14:12:03.527416
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1a7c3f95e20'
+down_revision: Union[str, None] = 'b4d2e8f61a07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'report_daily_rollups',
+        sa.Column('id', postgresql.INTEGER(), nullable=False),
+        sa.Column('day', postgresql.DATE(), nullable=False),
+        sa.Column('visitors', sa.Integer(), nullable=False),
+        sa.Column('revenue', postgresql.NUMERIC(), nullable=False),
+        sa.Column('reports_count', sa.Integer(), nullable=False),
+        sa.Column('place_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['place_id'], ['places.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['user_id'], ['employees.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'uq_report_daily_rollups_place_user_day', 'report_daily_rollups',
+        ['place_id', 'user_id', 'day'], unique=True,
+    )
+    op.create_index('ix_report_daily_rollups_day', 'report_daily_rollups', ['day'], unique=False)
+
+    # заполняем агрегаты по уже накопленным отчетам; бот на время миграции
+    # должен быть остановлен, иначе отчеты между этим запросом и деплоем не попадут в агрегат
+    op.execute(
+        """
+        INSERT INTO report_daily_rollups (place_id, user_id, day, visitors, revenue, reports_count)
+        SELECT place_id, user_id, report_date, sum(visitors), sum(CAST(revenue AS NUMERIC)), count(*)
+        FROM reports
+        GROUP BY place_id, user_id, report_date
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_report_daily_rollups_day', table_name='report_daily_rollups')
+    op.drop_index('uq_report_daily_rollups_place_user_day', table_name='report_daily_rollups')
+    op.drop_table('report_daily_rollups')
@@ -0,0 +1,49 @@
+"""report outbox
+
+Revision ID: e83f0b6c2a19
+Revises: d1a7c3f95e20
+Create Date: 2024-07-02 19:40:11.902341
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e83f0b6c2a19'
+down_revision: Union[str, None] = 'd1a7c3f95e20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'report_outbox',
+        sa.Column('id', postgresql.INTEGER(), nullable=False),
+        sa.Column('idempotency_key', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('chat_id', postgresql.BIGINT(), nullable=False),
+        sa.Column('user_id', postgresql.BIGINT(), nullable=False),
+        sa.Column('steps', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('progress', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('status', sa.String(), server_default=sa.text("'pending'"), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('next_attempt_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('sent_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('idempotency_key'),
+    )
+    op.create_index(
+        'ix_report_outbox_pending', 'report_outbox', ['next_attempt_at'],
+        unique=False, postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_report_outbox_pending', table_name='report_outbox', postgresql_where=sa.text("status = 'pending'"))
+    op.drop_table('report_outbox')
@@ -0,0 +1,44 @@
+"""job runs
+
+Revision ID: f5a9d2c71b38
+Revises: e83f0b6c2a19
+Create Date: 2024-07-09 18:12:47.530119
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5a9d2c71b38'
+down_revision: Union[str, None] = 'e83f0b6c2a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'job_runs',
+        sa.Column('id', postgresql.INTEGER(), nullable=False),
+        sa.Column('job_name', sa.String(), nullable=False),
+        sa.Column('scheduled_at', postgresql.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('parent_id', sa.Integer(), nullable=True),
+        sa.Column('place_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(), server_default=sa.text("'running'"), nullable=False),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('started_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('finished_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('duration_ms', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['parent_id'], ['job_runs.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['place_id'], ['places.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_job_runs_job_name_scheduled_at', 'job_runs', ['job_name', 'scheduled_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_job_runs_job_name_scheduled_at', table_name='job_runs')
+    op.drop_table('job_runs')
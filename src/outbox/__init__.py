@@ -0,0 +1,36 @@
+from typing import Optional, Sequence
+
+from aiogram.types import Message
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import async_session
+from src.db.queries.dao.dao import AsyncOrm
+from src.outbox.deliverer import OutboxDeliverer, build_report_steps
+from src.utils.media import MediaCategory
+
+outbox_deliverer = OutboxDeliverer(session_pool=async_session)
+
+
+async def enqueue_report(
+        kind: str,
+        message: Message,
+        chat_id: Optional[int],
+        text: str,
+        categories: Sequence[MediaCategory],
+        session: AsyncSession,
+        notes: Sequence[str] = (),
+) -> None:
+    # отчет только записывается в outbox в транзакции апдейта;
+    # после коммита нужно вызвать outbox_deliverer.wake()
+    if chat_id is None:
+        raise ValueError("У точки нет чата для отчетов")
+
+    await AsyncOrm.add_report_to_outbox(
+        # message - сообщение с последним вопросом флоу, оно уникально для каждого отчета
+        idempotency_key=f"{kind}:{message.chat.id}:{message.message_id}",
+        kind=kind,
+        chat_id=chat_id,
+        user_id=message.chat.id,
+        steps=build_report_steps(text=text, categories=categories, notes=notes),
+        session=session,
+    )
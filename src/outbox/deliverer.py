@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Sequence
+from uuid import uuid4
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InputMediaPhoto
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.config import settings
+from src.db.queries.dao.dao import AsyncOrm
+from src.utils.media import MediaCategory, pack_media
+
+logger = logging.getLogger(__name__)
+
+
+def build_report_steps(text: str, categories: Sequence[MediaCategory], notes: Sequence[str] = ()) -> List[Dict[str, Any]]:
+    # отчет раскладывается на шаги заранее, чтобы доставщику не нужны были ни FSM, ни БД
+    steps: List[Dict[str, Any]] = [{"method": "send_message", "text": text, "parse_mode": "html"}]
+    steps += [{"method": "send_message", "text": note} for note in notes]
+
+    for group in pack_media(categories):
+        if len(group) == 1:
+            steps.append({"method": "send_photo", "photo": group[0].media, "caption": group[0].caption})
+        else:
+            steps.append({
+                "method": "send_media_group",
+                "media": [{"media": item.media, "caption": item.caption} for item in group],
+            })
+
+    return steps
+
+
+class OutboxDeliverer:
+    """
+    Фоновая доставка отчетов из таблицы report_outbox в чаты точек.
+
+    Отчет попадает в outbox в той же транзакции, что и остальные данные
+    отчета, а сотрудник получает ответ сразу после коммита. Доставщик
+    отправляет шаги отчета по порядку и после каждого шага фиксирует прогресс,
+    поэтому после падения процесса отчет продолжится с недоставленного шага,
+    а не начнется заново. Каждый шаг продлевает аренду отчета и записывается
+    только при совпадении токена аренды и ожидаемого прогресса, поэтому
+    отчет, аренду которого перехватил другой доставщик, не отправится дважды.
+    Ошибки сети повторяются с растущей паузой,
+    отчеты, которые Telegram отвергает окончательно, помечаются failed,
+    и об этом узнает админ.
+    """
+
+    def __init__(
+            self,
+            session_pool: async_sessionmaker[AsyncSession],
+            batch_size: int = 20,
+            lease_seconds: float = 5 * 60,
+            poll_seconds: float = 30,
+            max_attempts: int = 10,
+    ):
+        self._session_pool = session_pool
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+
+    def wake(self) -> None:
+        # вызывается после коммита нового отчета, чтобы не ждать poll_seconds
+        self._wakeup.set()
+
+    async def run(self, bot: Bot) -> None:
+        while True:
+            try:
+                claimed = await self._deliver_due(bot)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка при доставке отчетов из outbox")
+                claimed = 0
+
+            # полная пачка - сразу берем следующую
+            if claimed >= self.batch_size:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _deliver_due(self, bot: Bot) -> int:
+        # у каждой аренды свой токен: если она истечет и отчет заберет
+        # другой доставщик (или этот же повторно), старая отправка это заметит
+        claim_token = uuid4().hex
+
+        async with self._session_pool() as session:
+            rows = await AsyncOrm.claim_outbox_reports(
+                limit=self.batch_size,
+                lease_seconds=self.lease_seconds,
+                claim_token=claim_token,
+                session=session,
+            )
+            await session.commit()
+
+        # разные чаты доставляются параллельно, отчеты одного чата - по очереди
+        by_chat = defaultdict(list)
+        for row in rows:
+            by_chat[row.chat_id].append(row)
+
+        await asyncio.gather(*(self._deliver_chat(bot, claim_token, chat_rows) for chat_rows in by_chat.values()))
+
+        return len(rows)
+
+    async def _deliver_chat(self, bot: Bot, claim_token: str, rows) -> None:
+        for row in rows:
+            await self._deliver(bot, claim_token, row)
+
+    async def _save_progress(self, row, claim_token: str, expected_progress: int, progress: int) -> bool:
+        async with self._session_pool() as session:
+            saved = await AsyncOrm.set_outbox_progress(
+                outbox_id=row.id,
+                claim_token=claim_token,
+                expected_progress=expected_progress,
+                progress=progress,
+                is_sent=progress == len(row.steps),
+                lease_seconds=self.lease_seconds,
+                session=session,
+            )
+            await session.commit()
+
+        if not saved:
+            logger.warning("Отчет %s уже доставляет другой процесс, отправка остановлена", row.id)
+
+        return saved
+
+    async def _deliver(self, bot: Bot, claim_token: str, row) -> None:
+        progress = row.progress
+
+        try:
+            # отчет мог ждать своей очереди в чате - проверяем, что аренда
+            # все еще наша, и продлеваем ее перед первым шагом
+            if not await self._save_progress(row, claim_token, progress, progress):
+                return
+
+            for step in row.steps[progress:]:
+                await self._send(bot, row.chat_id, step)
+
+                if not await self._save_progress(row, claim_token, progress, progress + 1):
+                    return
+                progress += 1
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            # повтор не поможет (бота удалили из чата, неверный file_id, ...)
+            await self._fail(bot, claim_token, row, e, retry=False)
+        except Exception as e:
+            await self._fail(bot, claim_token, row, e, retry=row.attempts + 1 < self.max_attempts)
+
+    async def _fail(self, bot: Bot, claim_token: str, row, error: Exception, retry: bool) -> None:
+        attempts = row.attempts + 1
+        logger.warning("Не удалось доставить отчет %s (попытка %s): %s", row.id, attempts, error)
+
+        async with self._session_pool() as session:
+            saved = await AsyncOrm.set_outbox_failure(
+                outbox_id=row.id,
+                claim_token=claim_token,
+                attempts=attempts,
+                error=str(error),
+                # 10с, 20с, 40с, ... но не реже раза в час
+                retry_in_seconds=min(10 * 2 ** (attempts - 1), 60 * 60) if retry else None,
+                session=session,
+            )
+            await session.commit()
+
+        # аренду уже забрал другой доставщик - судьбу отчета решает он
+        if not saved:
+            return
+
+        if not retry:
+            try:
+                await bot.send_message(
+                    text=f"Report delivery error: {error}\n"
+                         f"User id: {row.user_id}\n"
+                         f"Outbox id: {row.id}",
+                    chat_id=settings.ADMIN_ID,
+                )
+            except Exception:
+                logger.exception("Не удалось сообщить админу об ошибке доставки отчета %s", row.id)
+
+    @staticmethod
+    async def _send(bot: Bot, chat_id: int, step: Dict[str, Any]) -> None:
+        method = step["method"]
+
+        if method == "send_message":
+            await bot.send_message(chat_id=chat_id, text=step["text"], parse_mode=step.get("parse_mode"))
+        elif method == "send_photo":
+            await bot.send_photo(chat_id=chat_id, photo=step["photo"], caption=step.get("caption"))
+        elif method == "send_media_group":
+            await bot.send_media_group(chat_id=chat_id, media=[InputMediaPhoto(**item) for item in step["media"]])
+        else:
+            raise ValueError(f"Unknown outbox step: {method}")
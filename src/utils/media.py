@@ -0,0 +1,33 @@
+from typing import List, Sequence, Tuple
+
+from aiogram.types import InputMediaPhoto
+
+# Telegram принимает в sendMediaGroup от 2 до 10 элементов
+MEDIA_GROUP_LIMIT = 10
+
+# (подпись категории, file_id фотографий этой категории)
+MediaCategory = Tuple[str, Sequence[str]]
+
+
+def pack_media(categories: Sequence[MediaCategory]) -> List[List[InputMediaPhoto]]:
+    """
+    Складывает фото всех категорий отчета в минимальное число альбомов
+    по MEDIA_GROUP_LIMIT штук. У каждого фото своя подпись с названием
+    категории, поэтому в общем альбоме видно, что на каком фото.
+    """
+    media = []
+
+    for label, file_ids in categories:
+        for i, file_id in enumerate(file_ids):
+            caption = label if len(file_ids) == 1 else f"{label} ({i + 1}/{len(file_ids)})"
+            media.append(InputMediaPhoto(media=file_id, caption=caption))
+
+    groups = [media[i:i + MEDIA_GROUP_LIMIT] for i in range(0, len(media), MEDIA_GROUP_LIMIT)]
+
+    # альбом из одного фото отправить нельзя, поэтому забираем одно фото
+    # из предыдущего альбома - количество запросов от этого не меняется
+    if len(groups) > 1 and len(groups[-1]) == 1:
+        groups[-1].insert(0, groups[-2].pop())
+
+    return groups
+